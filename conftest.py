@@ -0,0 +1,120 @@
+import hashlib
+import os
+import sqlite3
+import httpx
+import pytest
+from uuid import uuid4
+
+SCHEMA_SOURCES = ("database.py", "main.py")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "database: needs the SQLite schema (deselect with -m 'not database')")
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--reuse-db", action="store_true", default=False,
+        help="restore the test DB from a cached snapshot instead of rebuilding the schema",
+    )
+
+
+def _snapshot_path(config):
+    # keyed on the files that define the schema, so editing either one makes a new snapshot
+    digest = hashlib.sha256()
+    for name in SCHEMA_SOURCES:
+        with open(config.rootpath / name, "rb") as f:
+            digest.update(f.read())
+    return config.cache.mkdir("db") / f"db_{digest.hexdigest()[:16]}.sqlite"
+
+
+@pytest.fixture(scope="session")
+def db_file():
+    # one in-memory DB for the whole session; the named shared-cache URI lets every
+    # pooled connection see the same DB, which lives as long as one of them is open.
+    # Under pytest-xdist (pytest -n auto) each worker is its own process with its own
+    # app state, and the worker id keeps the DB names apart as well.
+    import database
+    worker = os.environ.get("PYTEST_XDIST_WORKER", "gw0")
+    dbfile = f"file:test_{worker}_{uuid4().hex}?mode=memory&cache=shared"
+    database.set_database_file(dbfile, testing=True)
+    yield dbfile
+    database.close_all_connections()
+
+
+@pytest.fixture(scope="session")
+def test_db(db_file, pytestconfig):
+    # the schema is only created once a test marked @pytest.mark.database runs
+    import database
+    snapshot = _snapshot_path(pytestconfig) if pytestconfig.getoption("reuse_db") else None
+    if snapshot is not None and snapshot.exists():
+        src = sqlite3.connect(snapshot)
+        try:
+            with database.get_writer() as conn:
+                src.backup(conn)
+        finally:
+            src.close()
+    else:
+        database.init_db()
+        if snapshot is not None:
+            dst = sqlite3.connect(snapshot)
+            try:
+                with database.get_writer() as conn:
+                    conn.backup(dst)
+            finally:
+                dst.close()
+    return db_file
+
+
+@pytest.fixture
+def flights_table(test_db, app_main):
+    """Create and seed the flights table for one test, so bookings reserve and
+    release seats in the DB as well as in flights_by_id. Other tests run without
+    it and only use the in-memory seats.
+    """
+    import database
+    database.init_flights_table(seed_flights=app_main.flights_db)
+    yield
+    with database.get_writer() as conn:
+        conn.execute("DROP TABLE flights")
+    database._get_flight_meta.cache_clear()
+
+
+@pytest.fixture(scope="session")
+def app_main(db_file):
+    # import main only after the DB is configured
+    import main
+    return main
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+async def client(app_main, anyio_backend):
+    # requests go straight into the ASGI app on the test's event loop, without
+    # TestClient's thread portal; the app holds no per-test configuration, so one
+    # client serves every test
+    transport = httpx.ASGITransport(app=app_main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+        yield c
+
+
+@pytest.fixture(autouse=True)
+def isolate_state(request, app_main):
+    """Give each test an empty bookings table and the seeded in-memory state.
+    The app commits through several pooled connections, so a wrapping SAVEPOINT
+    can't undo its writes; emptying the table afterwards is just as cheap.
+    """
+    uses_db = request.node.get_closest_marker("database") is not None
+    if uses_db:
+        request.getfixturevalue("test_db")
+    yield
+    if uses_db:
+        import database
+        with database.get_writer() as conn:
+            conn.execute("DELETE FROM bookings")
+    app_main.reset_seats()
+    app_main.bookings_db.clear()
@@ -1,33 +1,199 @@
 import os
+import functools
+import logging
+import queue
 import sqlite3
+import threading
+import weakref
 from sqlite3 import Error
 from contextlib import contextmanager
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
 
 # Allow overriding DB file via env var or by assigning to DATABASE_FILE
 DATABASE_FILE = os.getenv("FLIGHT_DB_FILE", "flights.db")
 
-def set_database_file(path: str):
-    global DATABASE_FILE
+# journal_mode=WAL is stored in the database header, so it only has to be
+# switched on once per database file rather than on every connection
+_wal_enabled = False
+# set by set_database_file(testing=True): a throwaway test DB skips the
+# journal and fsyncs, since nothing in it has to survive a crash
+_testing = False
+
+# one long-lived connection per worker thread; reusing it keeps the page cache
+# warm and avoids re-opening the file and re-running PRAGMAs on every query.
+# The connection is closed again when its thread exits (see _ThreadConnection)
+_local = threading.local()
+_connections: list[sqlite3.Connection] = []
+_connections_lock = threading.Lock()
+# bumped whenever the pool is closed so threads drop their stale connection
+_pool_generation = 0
+
+# the flights helpers use their own connections: one writer, serialised by a
+# lock, and a pool of query_only readers that WAL lets run alongside it
+_writer: tuple[sqlite3.Connection, int] | None = None
+_writer_lock = threading.Lock()
+_reader_pool: queue.SimpleQueue = queue.SimpleQueue()
+
+# hot-path statements; passing the same string each call keeps hits in the
+# connection's prepared-statement cache
+_SQL_GET_FLIGHT_META = "SELECT origin, destination, duration, price FROM flights WHERE flight_id = ?"
+_SQL_SELECT_SEATS = "SELECT seats_available FROM flights WHERE flight_id = ?"
+_SQL_DEC_SEATS = "UPDATE flights SET seats_available = seats_available - ? WHERE flight_id = ? AND seats_available >= ?"
+_SQL_INC_SEATS = "UPDATE flights SET seats_available = seats_available + ? WHERE flight_id = ?"
+_SQL_SEED_FLIGHT = "INSERT INTO flights (flight_id, origin, destination, duration, price, seats_available) VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(flight_id) DO NOTHING"
+
+def set_database_file(path: str, testing: bool = False):
+    global DATABASE_FILE, _wal_enabled, _testing
+    close_all_connections()
     DATABASE_FILE = path
+    _wal_enabled = False
+    _testing = testing
+    _get_flight_meta.cache_clear()
+
+
+def _is_memory_database() -> bool:
+    # plain ":memory:" or a URI such as "file:name?mode=memory&cache=shared"
+    return DATABASE_FILE == ":memory:" or "mode=memory" in DATABASE_FILE
+
+
+def _configure_connection(conn: sqlite3.Connection):
+    """Apply per-connection PRAGMAs (and WAL mode on first open of the file).
+    WAL lets get_reader() connections run alongside the get_writer() connection,
+    and synchronous=NORMAL is durable enough under WAL while halving fsyncs.
+    """
+    global _wal_enabled
+    if _testing:
+        # no locking_mode=EXCLUSIVE: the writer and the reader pool share the file
+        conn.execute("PRAGMA journal_mode=MEMORY")
+        conn.execute("PRAGMA synchronous=OFF")
+    else:
+        if not _wal_enabled and not _is_memory_database():
+            conn.execute("PRAGMA journal_mode=WAL")
+            _wal_enabled = True
+        conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-64000")
+    conn.execute("PRAGMA mmap_size=268435456")
+    # wait on a locked database instead of failing immediately with SQLITE_BUSY
+    conn.execute("PRAGMA busy_timeout=5000")
+
+
+def _open_connection() -> sqlite3.Connection:
+    # thread-local and reader connections are used by one thread at a time and the
+    # writer is guarded by _writer_lock; check_same_thread is disabled so they can
+    # be handed between threads and closed from the shutdown hook.
+    # isolation_level=None turns off the implicit deferred BEGIN; writers issue
+    # BEGIN IMMEDIATE themselves so they never have to upgrade a read lock
+    # rows come back as plain tuples; only callers that need column-name access
+    # (the bookings code behind get_db_connection) pay for sqlite3.Row
+    conn = sqlite3.connect(DATABASE_FILE, check_same_thread=False, cached_statements=256, isolation_level=None, uri=DATABASE_FILE.startswith("file:"))
+    _configure_connection(conn)
+    with _connections_lock:
+        _connections.append(conn)
+    return conn
+
+
+def close_all_connections():
+    """Close every pooled connection (used on shutdown and when switching DB file)."""
+    global _pool_generation
+    with _connections_lock:
+        _pool_generation += 1
+        while not _reader_pool.empty():
+            _reader_pool.get_nowait()
+        while _connections:
+            try:
+                _connections.pop().close()
+            except Error:
+                pass
+
+
+def _discard_connection(conn: sqlite3.Connection):
+    with _connections_lock:
+        try:
+            _connections.remove(conn)
+        except ValueError:
+            # already closed by close_all_connections()
+            return
+    try:
+        conn.close()
+    except Error:
+        pass
+
+
+class _ThreadConnection:
+    """Holds a thread's connection in _local. The thread-local is dropped when its
+    thread exits (anyio recycles idle worker threads), which closes the connection
+    instead of leaving it open in _connections until shutdown.
+    """
+
+    __slots__ = ("conn", "generation", "__weakref__")
+
+    def __init__(self, conn: sqlite3.Connection, generation: int):
+        self.conn = conn
+        self.generation = generation
+        weakref.finalize(self, _discard_connection, conn)
 
 
 @contextmanager
 def get_db_connection():
+    """Yield the calling thread's pooled connection, opening it on first use.
+    The connection is kept open between calls; a transaction the caller leaves
+    uncommitted is rolled back on exit, as it was when the connection was closed.
+    """
     conn = None
     try:
-        conn = sqlite3.connect(DATABASE_FILE)
-        conn.row_factory = sqlite3.Row
+        holder = getattr(_local, "holder", None)
+        if holder is None or holder.generation != _pool_generation:
+            conn = _open_connection()
+            conn.row_factory = sqlite3.Row
+            _local.holder = _ThreadConnection(conn, _pool_generation)
+        else:
+            conn = holder.conn
         yield conn
     except Error as e:
-        print(f"Error connecting to database: {e}")
+        logger.warning("Database error: %s", e)
         raise
     finally:
-        if conn:
-            conn.close()
+        if conn is not None and conn.in_transaction:
+            conn.rollback()
+
+
+@contextmanager
+def get_writer():
+    """Yield the process-wide write connection, holding the writer lock."""
+    global _writer
+    with _writer_lock:
+        if _writer is None or _writer[1] != _pool_generation:
+            _writer = (_open_connection(), _pool_generation)
+        conn = _writer[0]
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+
+
+@contextmanager
+def get_reader():
+    """Yield a read-only connection from the reader pool and return it afterwards."""
+    generation = _pool_generation
+    try:
+        conn = _reader_pool.get_nowait()
+    except queue.Empty:
+        conn = _open_connection()
+        conn.execute("PRAGMA query_only=1")
+    try:
+        yield conn
+    finally:
+        # connections checked out across close_all_connections() are not reused
+        if generation == _pool_generation:
+            _reader_pool.put(conn)
 
 
 def init_db():
-    with get_db_connection() as conn:
+    with get_writer() as conn:
         conn.execute("""
         CREATE TABLE IF NOT EXISTS bookings (
             booking_id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -43,13 +209,60 @@ def init_db():
         )
         """)
         conn.commit()
+        _init_bookings_fts(conn)
+
+
+def _init_bookings_fts(conn: sqlite3.Connection):
+    """Create the trigram full-text index used for substring search on passenger name/email.
+    It is an external-content table kept in sync with bookings by triggers. SQLite builds
+    without FTS5 or the trigram tokenizer (< 3.34) skip it; search then falls back to LIKE.
+    """
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'bookings_fts'").fetchone() is not None
+    conn.execute("BEGIN")
+    try:
+        conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS bookings_fts USING fts5(
+            passenger_name, passenger_email,
+            content='bookings', content_rowid='booking_id', tokenize='trigram'
+        )
+        """)
+    except sqlite3.OperationalError as e:
+        conn.rollback()
+        logger.info("Full-text booking search unavailable: %s", e)
+        return
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS bookings_fts_ai AFTER INSERT ON bookings BEGIN
+        INSERT INTO bookings_fts(rowid, passenger_name, passenger_email)
+        VALUES (new.booking_id, new.passenger_name, new.passenger_email);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS bookings_fts_ad AFTER DELETE ON bookings BEGIN
+        INSERT INTO bookings_fts(bookings_fts, rowid, passenger_name, passenger_email)
+        VALUES ('delete', old.booking_id, old.passenger_name, old.passenger_email);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS bookings_fts_au AFTER UPDATE OF passenger_name, passenger_email ON bookings BEGIN
+        INSERT INTO bookings_fts(bookings_fts, rowid, passenger_name, passenger_email)
+        VALUES ('delete', old.booking_id, old.passenger_name, old.passenger_email);
+        INSERT INTO bookings_fts(rowid, passenger_name, passenger_email)
+        VALUES (new.booking_id, new.passenger_name, new.passenger_email);
+    END
+    """)
+    if not exists:
+        # index bookings written before the full-text table existed
+        conn.execute("INSERT INTO bookings_fts(bookings_fts) VALUES ('rebuild')")
+    conn.commit()
 
 
 def init_flights_table(seed_flights: list[dict] | None = None):
     """Create flights table (if missing) and optionally seed it with flights.
-    This function is idempotent: it only inserts seed rows when the table is empty.
+    This function is idempotent: seed rows whose flight_id already exists are skipped.
     """
-    with get_db_connection() as conn:
+    with get_writer() as conn:
+        # schema and seed rows share one transaction, so first boot commits once
+        conn.execute("BEGIN")
         conn.execute("""
         CREATE TABLE IF NOT EXISTS flights (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -61,26 +274,52 @@ def init_flights_table(seed_flights: list[dict] | None = None):
             seats_available INTEGER
         )
         """)
-        conn.commit()
+        # covering index: flight_id lookups are answered from the index alone,
+        # without a second B-tree search through the rowid table
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_flights_cover ON flights(flight_id, seats_available, origin, destination, duration, price)")
 
-        # seed if table empty and seed_flights provided
+        # seed if seed_flights provided; flight_id is UNIQUE, so existing flights
+        # are skipped by SQLite and concurrent initialisers cannot double-insert
         if seed_flights:
-            cur = conn.execute("SELECT COUNT(1) as c FROM flights")
-            count = cur.fetchone()[0]
-            if count == 0:
-                for f in seed_flights:
-                    conn.execute(
-                        "INSERT INTO flights (flight_id, origin, destination, duration, price, seats_available) VALUES (?, ?, ?, ?, ?, ?)",
-                        (f.get("flight_id"), f.get("origin"), f.get("destination"), f.get("duration"), f.get("price"), f.get("seats_available"))
-                    )
-                conn.commit()
-
-
-def get_flight(flight_id: str):
+            conn.executemany(
+                _SQL_SEED_FLIGHT,
+                ((f.get("flight_id"), f.get("origin"), f.get("destination"), f.get("duration"), f.get("price"), f.get("seats_available")) for f in seed_flights)
+            )
+        conn.commit()
+    # flights may have been added, including ids previously cached as missing
+    _get_flight_meta.cache_clear()
+
+
+@dataclass(slots=True)
+class FlightRecord:
+    """A row of the flights table as returned by get_flight."""
+    flight_id: str
+    origin: str
+    destination: str
+    duration: str
+    price: float
+    seats_available: int
+
+
+@functools.lru_cache(maxsize=1024)
+def _get_flight_meta(flight_id: str) -> tuple | None:
+    """(origin, destination, duration, price) for a flight, or None if unknown.
+    These columns are read-mostly, so they are cached per process; seat counts
+    change on every booking and are always read live by get_flight.
+    """
+    with get_reader() as conn:
+        row = conn.execute(_SQL_GET_FLIGHT_META, (flight_id,)).fetchone()
+        return row
+
+
+def get_flight(flight_id: str) -> FlightRecord | None:
     try:
-        with get_db_connection() as conn:
-            row = conn.execute("SELECT flight_id, origin, destination, duration, price, seats_available FROM flights WHERE flight_id = ?", (flight_id,)).fetchone()
-            return dict(row) if row else None
+        meta = _get_flight_meta(flight_id)
+        if meta is None:
+            return None
+        with get_reader() as conn:
+            row = conn.execute(_SQL_SELECT_SEATS, (flight_id,)).fetchone()
+            return FlightRecord(flight_id, *meta, row[0]) if row else None
     except Error:
         # flights table may not exist in some setups; treat as no DB-backed flight
         return None
@@ -93,25 +332,24 @@ def reserve_seats(flight_id: str, seats: int) -> tuple[bool, str | None]:
     if seats <= 0:
         return False, "seats must be >= 1"
     try:
-        with get_db_connection() as conn:
-            # use immediate transaction to acquire a reserved lock for writing
+        # unknown ids are rejected before taking the write lock
+        if _get_flight_meta(flight_id) is None:
+            return False, "flight not found"
+        with get_writer() as conn:
+            # the WHERE clause enforces availability, so check-and-decrement is one statement
             conn.execute("BEGIN IMMEDIATE")
-            row = conn.execute("SELECT seats_available FROM flights WHERE flight_id = ?", (flight_id,)).fetchone()
-            if row is None:
-                conn.execute("ROLLBACK")
-                return False, "flight not found"
-            available = int(row[0])
-            if available < seats:
+            try:
+                cur = conn.execute(_SQL_DEC_SEATS, (seats, flight_id, seats))
+                conn.execute("COMMIT")
+            except Error:
                 conn.execute("ROLLBACK")
+                raise
+            if cur.rowcount == 0:
                 return False, "not enough seats"
-            conn.execute("UPDATE flights SET seats_available = seats_available - ? WHERE flight_id = ?", (seats, flight_id))
-            conn.commit()
             return True, None
-    except Exception as e:
-        try:
-            conn.rollback()
-        except Exception:
-            pass
+    except Error as e:
+        # get_writer has already rolled back any open transaction
+        logger.warning("Failed to reserve %s seat(s) on flight %s: %s", seats, flight_id, e)
         return False, str(e)
 
 
@@ -122,18 +360,19 @@ def release_seats(flight_id: str, seats: int) -> tuple[bool, str | None]:
     if seats <= 0:
         return False, "seats must be >= 1"
     try:
-        with get_db_connection() as conn:
+        if _get_flight_meta(flight_id) is None:
+            return False, "flight not found"
+        with get_writer() as conn:
             conn.execute("BEGIN IMMEDIATE")
-            row = conn.execute("SELECT seats_available FROM flights WHERE flight_id = ?", (flight_id,)).fetchone()
-            if row is None:
+            try:
+                cur = conn.execute(_SQL_INC_SEATS, (seats, flight_id))
+                conn.execute("COMMIT")
+            except Error:
                 conn.execute("ROLLBACK")
+                raise
+            if cur.rowcount == 0:
                 return False, "flight not found"
-            conn.execute("UPDATE flights SET seats_available = seats_available + ? WHERE flight_id = ?", (seats, flight_id))
-            conn.commit()
             return True, None
-    except Exception as e:
-        try:
-            conn.rollback()
-        except Exception:
-            pass
+    except Error as e:
+        logger.warning("Failed to release %s seat(s) on flight %s: %s", seats, flight_id, e)
         return False, str(e)
\ No newline at end of file
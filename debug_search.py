@@ -1,22 +1,53 @@
-from pathlib import Path
+import asyncio
+import os
+import tempfile
+import httpx
 import database
 
-# Use a local debug DB file
-dbfile = str(Path.cwd() / "test_debug.db")
+# Use a throwaway temp-file DB so every run starts clean. It has to be a file in
+# WAL mode: a shared-cache in-memory DB takes table-level locks, and the
+# concurrent flows would fail with "database table is locked" (SQLITE_LOCKED is
+# not retried by busy_timeout).
+fd, dbfile = tempfile.mkstemp(suffix=".db", prefix="debug_search_")
+os.close(fd)
 database.set_database_file(dbfile)
 database.init_db()
 
 import main as app_main
-from fastapi.testclient import TestClient
-client = TestClient(app_main.app)
-
-print('start booking')
-resp = client.post('/booking_flow/start', json={'flight_id':'AI-201','seats':1})
-print('start', resp.status_code, resp.text)
-pnr = resp.json()['pnr']
-resp = client.post(f'/booking_flow/{pnr}/passenger', json={'full_name':'Search User','last_name':'Finder','age':29,'phone':9002002002,'passport_no':'S11111'})
-print('passenger', resp.status_code, resp.text)
-resp = client.post(f'/booking_flow/{pnr}/pay', json={'payment_method':'card','fail_rate':0.0})
-print('pay', resp.status_code, resp.text)
-resp = client.get('/bookings/search', params={'name':'Search'})
-print('search', resp.status_code, resp.text)
+
+# number of independent booking flows driven concurrently
+FLOWS = 4
+
+
+async def flow(client, i):
+    name = f'Search User {i}'
+    print(i, 'start booking')
+    resp = await client.post('/booking_flow/start', json={'flight_id':'AI-201','seats':1})
+    print(i, 'start', resp.status_code, resp.text)
+    pnr = resp.json()['pnr']
+    resp = await client.post(f'/booking_flow/{pnr}/passenger', json={'full_name':name,'last_name':'Finder','age':29,'phone':9002002002,'passport_no':f'S1111{i}'})
+    print(i, 'passenger', resp.status_code, resp.text)
+    resp = await client.post(f'/booking_flow/{pnr}/pay', json={'payment_method':'card','fail_rate':0.0})
+    print(i, 'pay', resp.status_code, resp.text)
+    resp = await client.get('/bookings/search', params={'name':name})
+    print(i, 'search', resp.status_code, resp.text)
+
+
+async def main():
+    # run the app's startup/shutdown once around all flows (ASGITransport does not
+    # send lifespan events), and share one client/transport between the flows
+    async with app_main.app.router.lifespan_context(app_main.app):
+        transport = httpx.ASGITransport(app=app_main.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            await asyncio.gather(*[flow(client, i) for i in range(FLOWS)])
+
+
+try:
+    asyncio.run(main())
+finally:
+    database.close_all_connections()
+    for path in (dbfile, dbfile + "-wal", dbfile + "-shm"):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
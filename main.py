@@ -1,22 +1,71 @@
-from fastapi import FastAPI, HTTPException, status, Query, BackgroundTasks
+from fastapi import FastAPI, HTTPException, status, Query, BackgroundTasks, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from enum import Enum
 import re
 import random
 import asyncio
-from database import get_db_connection, init_db, init_flights_table, reserve_seats, release_seats, get_flight
+import functools
+import hashlib
+from database import get_db_connection, get_reader, get_writer, init_db, init_flights_table, reserve_seats, release_seats, get_flight, close_all_connections
 from datetime import datetime, date, timedelta
 import math
 import time
 from typing import Dict, List, Optional
-from collections import defaultdict
-from statistics import mean, median
+from collections import OrderedDict, defaultdict, deque
+from statistics import median
 import json
+from operator import attrgetter, itemgetter
+from bisect import bisect_left
+from itertools import islice
 from pydantic import BaseModel, Field
 import string
 import secrets
-
-app = FastAPI()
+import sqlite3
+import sys
+import threading
+
+try:
+    import uvloop
+except ImportError:  # optional; the default asyncio loop is used without it
+    uvloop = None
+
+# libuv-based event loop for lower per-callback overhead. uvicorn already picks
+# uvloop up when it is installed (loop="auto"); installing the policy here also
+# covers other runners such as debug_search.py's asyncio.run().
+if uvloop is not None and sys.platform != "win32":
+    uvloop.install()
+
+try:
+    import orjson
+except ImportError:  # optional; responses are rendered with the json module without it
+    orjson = None
+
+class _OrjsonResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+# orjson renders the response bodies when it is installed; without it FastAPI keeps
+# its default response class (and the direct-to-JSON path for response models)
+app = FastAPI(default_response_class=_OrjsonResponse) if orjson is not None else FastAPI()
+_JSONResponseClass = _OrjsonResponse if orjson is not None else JSONResponse
+
+def _cacheable_json(request: Request, content, max_age: int | None) -> Response:
+    """Render content as JSON with Cache-Control and a weak ETag of the body.
+    A request whose If-None-Match already carries that ETag gets an empty 304.
+    max_age=None sends "private, no-cache" for handlers with side effects: clients
+    may still revalidate, but every request reaches the handler.
+    """
+    response = _JSONResponseClass(jsonable_encoder(content))
+    etag = f'W/"{hashlib.md5(response.body, usedforsecurity=False).hexdigest()}"'
+    cache_control = "private, no-cache" if max_age is None else f"public, max-age={max_age}"
+    headers = {"Cache-Control": cache_control, "ETag": etag}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in (t.strip() for t in if_none_match.split(","))):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return response
 
 
 app.add_middleware(
@@ -26,13 +75,27 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# flight_id -> simulated demand in [0, 1]; demand_simulation holds this same dict,
+# so it must be updated in place, never rebound
+current_demand_levels: dict[str, float] = {}
 demand_simulation = {
     "is_running": False,
-    "current_demand_levels": {},  
+    "current_demand_levels": current_demand_levels,
     "last_update": None,
     "update_interval": 30,  
 }
-fare_history = defaultdict(list)
+# per-flight price points in insertion (= timestamp) order, oldest on the left
+fare_history = defaultdict(deque)
+# points older than this are dropped by the background sweeper
+FARE_HISTORY_RETENTION = timedelta(days=7)
+FARE_HISTORY_SWEEP_INTERVAL = 60
+_fare_history_sweeper: asyncio.Task | None = None
+# fare-history analytics and price alerts are reused for a few seconds, unless the
+# flight records a new price point first
+FARE_ANALYTICS_CACHE_TTL = 15.0
+_FARE_ANALYTICS_MAX_ENTRIES = 64
+# flight_id -> {(endpoint, query params): (expires_at, result)}
+_fare_analytics_cache: dict[str, dict[tuple, tuple[float, dict | None]]] = {}
 
 class PricePoint(BaseModel):
     timestamp: datetime
@@ -54,6 +117,8 @@ def record_price_change(
     seats_available: int,
     breakdown: dict | None = None
 ):
+    # retention is handled by _sweep_fare_history, so recording is a plain append
+    _fare_analytics_cache.pop(flight_id, None)
     fare_history[flight_id].append(
         PricePoint(
             timestamp=datetime.now(),
@@ -64,37 +129,165 @@ def record_price_change(
             breakdown=breakdown
         )
     )
-    cutoff = datetime.now() - timedelta(days=7)
-    fare_history[flight_id] = [
-        point for point in fare_history[flight_id]
-        if point.timestamp >= cutoff
-    ]
+
+def prune_fare_history(now: datetime | None = None):
+    """Drop price points older than FARE_HISTORY_RETENTION from every flight."""
+    cutoff = (now or datetime.now()) - FARE_HISTORY_RETENTION
+    for history in list(fare_history.values()):
+        # points are appended in time order, so the expired ones form a prefix
+        expired = bisect_left(history, cutoff, key=attrgetter("timestamp"))
+        for _ in range(expired):
+            history.popleft()
+
+async def _sweep_fare_history():
+    while True:
+        await asyncio.sleep(FARE_HISTORY_SWEEP_INTERVAL)
+        prune_fare_history()
+
+def _recent_fare_points(flight_id: str, hours: int) -> list[PricePoint]:
+    """Price points of the last `hours` hours, oldest first."""
+    history = fare_history[flight_id]
+    cutoff = datetime.now() - timedelta(hours=hours)
+    # points are appended in time order, so the window is a suffix: binary-search
+    # its start and copy only those points (walking in from the right end)
+    start = bisect_left(history, cutoff, key=attrgetter("timestamp"))
+    recent = list(islice(reversed(history), len(history) - start))
+    recent.reverse()
+    return recent
+
+def _cached_fare_analytics(flight_id: str, key: tuple, build) -> dict | None:
+    now = time.monotonic()
+    entries = _fare_analytics_cache.setdefault(flight_id, {})
+    cached = entries.get(key)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    result = build()
+    if len(entries) >= _FARE_ANALYTICS_MAX_ENTRIES:
+        entries.clear()
+    entries[key] = (now + FARE_ANALYTICS_CACHE_TTL, result)
+    return result
+
+def _fare_analytics(history: list[PricePoint], hours: int) -> dict | None:
+    if not history:
+        return None
+    # one pass over the points; prices are kept as a list for the median, and
+    # their min/max run in C over that list
+    first = history[0]
+    demand_min = demand_max = first.demand_level
+    seats_min = seats_max = first.seats_available
+    demand_total = 0.0
+    prices = []
+    for p in history:
+        prices.append(p.price)
+        demand = p.demand_level
+        demand_total += demand
+        if demand < demand_min:
+            demand_min = demand
+        elif demand > demand_max:
+            demand_max = demand
+        seats = p.seats_available
+        if seats < seats_min:
+            seats_min = seats
+        elif seats > seats_max:
+            seats_max = seats
+    count = len(history)
+    return {
+        "price": {
+            "min": min(prices),
+            "max": max(prices),
+            "avg": round(math.fsum(prices) / count, 2),
+            "median": round(median(prices), 2),
+        },
+        "demand": {
+            "min": demand_min,
+            "max": demand_max,
+            "avg": round(demand_total / count, 3),
+        },
+        "seats_available": {
+            "min": seats_min,
+            "max": seats_max,
+            "last": history[-1].seats_available,
+        },
+        "total_changes": len(history),
+        "period_hours": hours,
+    }
+
+def _price_alerts(history: list[PricePoint], threshold_percent: float) -> dict:
+    if not history:
+        return {"alerts": [], "threshold_percent": threshold_percent}
+    alerts = []
+    # the baseline resets after each alert, so this stays a sequential scan;
+    # locals keep the per-point work to attribute reads and float math
+    append = alerts.append
+    abs_ = abs
+    baseline = history[0].price
+    for point in islice(history, 1, None):
+        price = point.price
+        pct_change = ((price - baseline) / baseline) * 100
+        if abs_(pct_change) >= threshold_percent:
+            append({
+                "timestamp": point.timestamp,
+                "old_price": baseline,
+                "new_price": price,
+                "percent_change": round(pct_change, 2),
+                "demand_level": point.demand_level,
+                "seats_available": point.seats_available
+            })
+            baseline = price
+    return {
+        "alerts": alerts,
+        "threshold_percent": threshold_percent,
+        "total_changes": len(history) - 1,
+        "significant_changes": len(alerts)
+    }
+# dedicated generator for the demand simulation, so its draws neither share nor
+# disturb the state of the generator used by the endpoints
+_demand_rng = random.Random()
+# generator for the simulated payment and provider failures
+_failure_rng = random.Random()
+# commute hours that get an extra demand bump on top of the business-hours one
+_PEAK_HOURS = frozenset({8, 9, 17, 18})
+
+def _simulated_failure(rate: float) -> bool:
+    # rates of 0 and 1 (never / always fail) are decided without a draw
+    if rate <= 0.0:
+        return False
+    if rate >= 1.0:
+        return True
+    return _failure_rng.random() < rate
+
 async def simulate_demand_changes():
     while demand_simulation["is_running"]:
         now = datetime.now()
         demand_simulation["last_update"] = now
+        # the time-of-day bonus is the same for every flight in a tick
+        hour = now.hour
+        hour_bonus = (0.1 if 9 <= hour <= 17 else 0.0) + (0.2 if hour in _PEAK_HOURS else 0.0)
+        # normalvariate keeps no state between calls, unlike gauss, so it stays
+        # thread-safe if the generator is ever shared beyond this task
+        normal = _demand_rng.normalvariate
+        rand = _demand_rng.random
         for flight in flights_db:
             flight_id = flight.get("flight_id")
             if not flight_id:
                 continue
-            current_demand = demand_simulation["current_demand_levels"].get(flight_id, random.random())
-            change = random.gauss(0, 0.1)
+            current_demand = current_demand_levels.get(flight_id)
+            if current_demand is None:
+                current_demand = rand()
+            change = normal(0, 0.1)
             mean_reversion = 0.5 - current_demand
             new_demand = current_demand + change + (mean_reversion * 0.1)
             new_demand = max(0.0, min(1.0, new_demand))
-            hour = now.hour
-            if 9 <= hour <= 17:
-                new_demand += 0.1
-            if hour in [8, 9, 17, 18]:
-                new_demand += 0.2
-            new_demand = max(0.0, min(1.0, new_demand))
-            demand_simulation["current_demand_levels"][flight_id] = new_demand
-            seats = flight.get("seats_available", 0)
-            if seats > 0:
-                booking_chance = new_demand * 0.3
-                if random.random() < booking_chance:
-                    seats_change = -random.randint(1, min(3, seats))
-                    flight["seats_available"] = max(0, seats + seats_change)
+            new_demand = max(0.0, min(1.0, new_demand + hour_bonus))
+            current_demand_levels[flight_id] = new_demand
+            booking_chance = new_demand * 0.3
+            if rand() < booking_chance:
+                with _seats_lock:
+                    seats = flight.get("seats_available", 0)
+                    if seats > 0:
+                        seats_change = -_demand_rng.randint(1, min(3, seats))
+                        flight["seats_available"] = max(0, seats + seats_change)
+        invalidate_flights_cache()
         await asyncio.sleep(demand_simulation["update_interval"])
 async def start_demand_simulation(background_tasks: BackgroundTasks):
     if not demand_simulation["is_running"]:
@@ -111,11 +304,18 @@ async def stop_demand_simulation():
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    global _fare_history_sweeper
     await stop_demand_simulation()
+    if _fare_history_sweeper is not None:
+        _fare_history_sweeper.cancel()
+        _fare_history_sweeper = None
+    close_all_connections()
 
 @app.on_event("startup")
 async def startup_event():
+    global _fare_history_sweeper
     init_db()
+    _fare_history_sweeper = asyncio.create_task(_sweep_fare_history())
     # ensure flights table exists and is seeded with in-memory flights_db defaults (only if empty)
     try:
         init_flights_table(seed_flights=flights_db)
@@ -153,17 +353,70 @@ class SortBy(str, Enum):
 class Order(str, Enum):
     asc = "asc"
     desc = "desc"
+_DURATION_NUMBER_RE = re.compile(r"([0-9]+(?:\.[0-9]+)?)")
+_DURATION_MINUTES_RE = re.compile(r"min|minute|mins", re.I)
+
+# the fleet shares a handful of duration strings, so parses are memoized
+@functools.lru_cache(maxsize=1024)
 def _parse_duration_to_hours(duration_str: str) -> float:
     if not duration_str:
         raise ValueError("empty duration")
-    m = re.search(r"([0-9]+(?:\.[0-9]+)?)", str(duration_str))
+    m = _DURATION_NUMBER_RE.search(str(duration_str))
     if not m:
         raise ValueError(f"Cannot parse duration: {duration_str}")
     val = float(m.group(1))
-    if re.search(r"min|minute|mins", duration_str, re.I):
+    if _DURATION_MINUTES_RE.search(duration_str):
         return val / 60.0
     return val
 
+def _within_price_floor(flights: list[dict], max_price: float | None) -> list[dict]:
+    """Drop flights whose lowest possible dynamic price is already above max_price,
+    so they are never priced. The final price is rounded from a value clamped to at
+    least base_price * MIN_PRICE_FACTOR, so the rounded floor is a true lower bound.
+    """
+    if max_price is None:
+        return flights
+    return [f for f in flights if round(float(f.get("price") or 0.0) * MIN_PRICE_FACTOR, 2) <= max_price]
+
+def _priced_flight(flight: dict, price_info: dict, include_price_breakdown: bool) -> dict:
+    # built directly with the response fields rather than copying and patching the flight dict
+    result = {
+        "flight_id": flight["flight_id"],
+        "origin": flight["origin"],
+        "destination": flight["destination"],
+        "duration": flight["duration"],
+        "price": price_info["final_price"],
+        "seats_available": flight["seats_available"],
+        "base_price": flight["price"],
+    }
+    if include_price_breakdown:
+        result["price_breakdown"] = price_info["breakdown"]
+    return result
+
+# /flights and /search results are reused for a few seconds, unless a flight changes first
+FLIGHTS_CACHE_TTL = 5.0
+_FLIGHTS_CACHE_MAX_ENTRIES = 256
+# (endpoint, query params) -> (expires_at, generation, results)
+_flights_cache: dict[tuple, tuple[float, int, list]] = {}
+_flights_generation = 0
+
+def invalidate_flights_cache():
+    """Mark every cached flight listing stale; call after changing flights_db."""
+    global _flights_generation
+    _flights_generation += 1
+
+def _cached_flights(key: tuple, build) -> list:
+    now = time.monotonic()
+    cached = _flights_cache.get(key)
+    if cached is not None and cached[0] > now and cached[1] == _flights_generation:
+        return cached[2]
+    generation = _flights_generation
+    results = build()
+    if len(_flights_cache) >= _FLIGHTS_CACHE_MAX_ENTRIES:
+        _flights_cache.clear()
+    _flights_cache[key] = (now + FLIGHTS_CACHE_TTL, generation, results)
+    return results
+
 @app.get("/flights")
 def get_all_flights(
     sort_by: SortBy | None = Query(None, description="Sort by 'price' or 'duration'."),
@@ -175,39 +428,45 @@ def get_all_flights(
 ):
     if max_price is not None and max_price < 0:
         raise HTTPException(status_code=400, detail="max_price must be >= 0")
-    results = []
-    for flight in flights_db:
-        try:
-            price_info = compute_dynamic_price(
-                base_price=float(flight.get("price") or 0.0),
-                seats_available=int(flight.get("seats_available", 0)),
-                travel_date=travel_date,
-                demand_level=demand_level if demand_level is not None else get_flight_demand(flight.get("flight_id", ""))
-            )
-            flight_copy = dict(flight)
-            flight_copy["base_price"] = flight_copy.get("price")
-            flight_copy["price"] = price_info["final_price"]
-            if include_price_breakdown:
-                flight_copy["price_breakdown"] = price_info["breakdown"]
-            results.append(flight_copy)
-        except ValueError as e:
-            continue
+    # pricing rounds demand to 2 decimals, so requests that differ by less share an entry
+    key = ("flights", sort_by, order, max_price, travel_date, round(demand_level, 2), include_price_breakdown)
+    return _cached_flights(
+        key, lambda: _list_flights(sort_by, order, max_price, travel_date, demand_level, include_price_breakdown)
+    )
+
+def _list_flights(
+    sort_by: SortBy | None,
+    order: Order,
+    max_price: float | None,
+    travel_date: str | None,
+    demand_level: float,
+    include_price_breakdown: bool,
+) -> list:
+    try:
+        priced = compute_dynamic_prices(
+            _within_price_floor(flights_db, max_price), travel_date=travel_date, demand_level=demand_level,
+            return_breakdown=include_price_breakdown,
+        )
+    except ValueError:
+        # an unparseable travel_date makes every flight unpriceable
+        return []
     if max_price is not None:
-        filtered = []
-        for f in results:
-            price = f.get("price")
-            if isinstance(price, (int, float)) and price <= max_price:
-                filtered.append(f)
-        results = filtered
+        # filter on the computed price before building the response dicts
+        priced = [(flight, price_info) for flight, price_info in priced if price_info["final_price"] <= max_price]
+    results = [_priced_flight(flight, price_info, include_price_breakdown) for flight, price_info in priced]
     if sort_by is not None:
         reverse = order == Order.desc
         if sort_by == SortBy.price:
-            results.sort(key=lambda f: (float('inf') if not isinstance(f.get("price"), (int, float)) else f["price"]), reverse=reverse)
+            # every price here is a float produced by compute_dynamic_prices
+            results.sort(key=itemgetter("price"), reverse=reverse)
         elif sort_by == SortBy.duration:
+            # parse each duration once up front, then sort on the parsed keys
             try:
-                results.sort(key=lambda f: _parse_duration_to_hours(f.get("duration", "")), reverse=reverse)
+                keyed = [(_parse_duration_to_hours(f.get("duration", "")), f) for f in results]
             except ValueError as e:
                 raise HTTPException(status_code=400, detail=str(e))
+            keyed.sort(key=itemgetter(0), reverse=reverse)
+            results = [f for _, f in keyed]
     return results
 
 
@@ -235,6 +494,25 @@ def get_flight_details(flight_id: str, origin: str, destination: str, duration:
         ]
     }
 
+def _search_route(
+    route: tuple[str, str],
+    travel_date: str | None,
+    price_limit: float | None,
+    demand_level: float | None,
+    include_price_breakdown: bool,
+) -> list:
+    # only flights on the requested route are priced
+    candidates = _within_price_floor(flights_by_route.get(route, []), price_limit)
+    try:
+        priced = compute_dynamic_prices(candidates, travel_date=travel_date, demand_level=demand_level, return_breakdown=include_price_breakdown)
+    except ValueError:
+        return []
+    return [
+        _priced_flight(flight, price_info, include_price_breakdown)
+        for flight, price_info in priced
+        if price_limit is None or price_info["final_price"] <= price_limit
+    ]
+
 @app.get("/search")
 def search_with_filters(
     origin: str,
@@ -244,17 +522,12 @@ def search_with_filters(
     demand_level: float | None = Query(None, description="Optional override for demand level (0.0-1.0). If not provided, uses simulated demand.", ge=0.0, le=1.0),
     include_price_breakdown: bool = Query(False, description="Include dynamic price calculation breakdown"),
 ):
-    all_flights = get_all_flights(
-        travel_date=date,
-        demand_level=demand_level,
-        include_price_breakdown=include_price_breakdown,
+    route = (origin.lower(), destination.lower())
+    demand_key = round(demand_level, 2) if demand_level is not None else None
+    matches = _cached_flights(
+        ("search", route, date, price_limit, demand_key, include_price_breakdown),
+        lambda: _search_route(route, date, price_limit, demand_level, include_price_breakdown),
     )
-    matches = []
-    for flight in all_flights:
-        if (flight.get("origin", "").lower() == origin.lower() and
-            flight.get("destination", "").lower() == destination.lower() and
-            (price_limit is None or flight.get("price", float("inf")) <= price_limit)):
-            matches.append(flight) 
     return {
         "search_criteria": {
             "origin": origin,
@@ -442,17 +715,15 @@ class Booking(BaseModel):
     status: str = Field(..., description="Booking status (confirmed, cancelled, pending)")
     price: float = Field(..., description="Total price of the booking")
 
+_SQL_INSERT_BOOKING = "INSERT INTO bookings (pnr, flight_id, passenger_name, passenger_email, passenger_phone, seats, status, price) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+
 @app.post("/bookings", response_model=Booking)
 async def create_booking(booking: Booking):
     # generate a final PNR for this direct create flow
     final_pnr = generate_unique_pnr()
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO bookings
-            (pnr, flight_id, passenger_name, passenger_email, passenger_phone, seats, status, price)
-            VALUES ("AI-301","Valli Tade","valli@example.com","8907654321",1,"confirmed",8500.00)
-        """, (
+        cursor.execute(_SQL_INSERT_BOOKING, (
             final_pnr,
             booking.flight_id,
             booking.passenger_name,
@@ -467,7 +738,7 @@ async def create_booking(booking: Booking):
         booking.pnr = final_pnr
         return booking
 
-@app.get("/bookings/{booking_id}", response_model=Booking)
+@app.get("/bookings/{booking_id:int}", response_model=Booking)
 async def get_booking(booking_id: int):
     with get_db_connection() as conn:
         cursor = conn.cursor()
@@ -493,33 +764,8 @@ async def get_booking_by_pnr(pnr: str):
         if row:
             return Booking(**dict(row))
 
-
-        @app.get("/bookings/{booking_id}/history")
-        async def get_booking_history(booking_id: int):
-            """Return history events for a given persisted booking_id."""
-            with get_db_connection() as conn:
-                cursor = conn.cursor()
-                rows = cursor.execute("SELECT id, booking_id, pnr, event_type, timestamp, details FROM booking_history WHERE booking_id = ? ORDER BY id ASC", (booking_id,)).fetchall()
-                events = []
-                for r in rows:
-                    rec = dict(r)
-                    # parse details JSON if present
-                    try:
-                        rec_details = json.loads(rec.get("details") or "{}")
-                    except Exception:
-                        rec_details = rec.get("details")
-                    events.append({
-                        "id": rec.get("id"),
-                        "booking_id": rec.get("booking_id"),
-                        "pnr": rec.get("pnr"),
-                        "event_type": rec.get("event_type"),
-                        "timestamp": rec.get("timestamp"),
-                        "details": rec_details,
-                    })
-                return {"booking_id": booking_id, "events": events}
-
     # fallback to temporary in-memory bookings
-    tb = next((b for b in bookings_db if (b.get("pnr") == pnr or b.get("pnr") == pnr.upper())), None)
+    tb = bookings_db.get(pnr.upper())
     if tb:
         data = {
             "booking_id": tb.get("booking_id"),
@@ -537,6 +783,34 @@ async def get_booking_by_pnr(pnr: str):
     raise HTTPException(status_code=404, detail=f"Booking with PNR {pnr} not found")
 
 
+@app.get("/bookings/{booking_id:int}/history")
+async def get_booking_history(booking_id: int):
+    """Return history events for a given persisted booking_id."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        rows = cursor.execute("SELECT id, booking_id, pnr, event_type, timestamp, details FROM booking_history WHERE booking_id = ? ORDER BY id ASC", (booking_id,)).fetchall()
+        events = []
+        for r in rows:
+            rec = dict(r)
+            # parse details JSON if present
+            try:
+                rec_details = json.loads(rec.get("details") or "{}")
+            except Exception:
+                rec_details = rec.get("details")
+            events.append({
+                "id": rec.get("id"),
+                "booking_id": rec.get("booking_id"),
+                "pnr": rec.get("pnr"),
+                "event_type": rec.get("event_type"),
+                "timestamp": rec.get("timestamp"),
+                "details": rec_details,
+            })
+        return {"booking_id": booking_id, "events": events}
+
+
+# the columns the Booking model reads, instead of SELECT *
+_BOOKING_COLUMNS = "booking_id, pnr, flight_id, passenger_name, passenger_email, passenger_phone, seats, status, price"
+
 @app.get("/bookings/search")
 async def search_bookings(name: Optional[str] = None, email: Optional[str] = None, limit: int = 50):
     """Search persisted and temporary bookings by passenger name and/or email (case-insensitive, substring).
@@ -551,17 +825,27 @@ async def search_bookings(name: Optional[str] = None, email: Optional[str] = Non
     with get_db_connection() as conn:
         cursor = conn.cursor()
         if name_param is None and email_param is None:
-            rows = cursor.execute("SELECT * FROM bookings ORDER BY booking_id DESC LIMIT ?", (limit,)).fetchall()
+            rows = cursor.execute(f"SELECT {_BOOKING_COLUMNS} FROM bookings ORDER BY booking_id DESC LIMIT ?", (limit,)).fetchall()
         else:
-            # use lower(...) for case-insensitive match
-            query = "SELECT * FROM bookings WHERE (? IS NULL OR lower(passenger_name) LIKE lower(?)) AND (? IS NULL OR lower(passenger_email) LIKE lower(?)) ORDER BY booking_id DESC LIMIT ?"
-            rows = cursor.execute(query, (name_param, name_param, email_param, email_param, limit)).fetchall()
+            # only the given filters go into the WHERE clause, so each one can use the index
+            columns = [c for c, v in (("passenger_name", name_param), ("passenger_email", email_param)) if v is not None]
+            params = [v for v in (name_param, email_param) if v is not None] + [limit]
+            try:
+                # the trigram index answers '%term%' LIKE (case-insensitive) without a table scan
+                where = " AND ".join(f"{c} LIKE ?" for c in columns)
+                query = f"SELECT {_BOOKING_COLUMNS} FROM bookings WHERE booking_id IN (SELECT rowid FROM bookings_fts WHERE {where}) ORDER BY booking_id DESC LIMIT ?"
+                rows = cursor.execute(query, params).fetchall()
+            except sqlite3.OperationalError:
+                # no bookings_fts (SQLite without FTS5 trigram support): scan bookings
+                where = " AND ".join(f"lower({c}) LIKE lower(?)" for c in columns)
+                query = f"SELECT {_BOOKING_COLUMNS} FROM bookings WHERE {where} ORDER BY booking_id DESC LIMIT ?"
+                rows = cursor.execute(query, params).fetchall()
         for r in rows:
             results.append(dict(r))
 
     # search temporary in-memory bookings
-    seen_pnrs = {b.pnr for b in results if b.pnr}
-    for tb in bookings_db:
+    seen_pnrs = {b["pnr"] for b in results if b["pnr"]}
+    for tb in bookings_db.values():
         p = tb.get("passenger")
         if not p:
             continue
@@ -601,91 +885,151 @@ async def list_bookings(limit: int = 10, offset: int = 0):
     with get_db_connection() as conn:
         cursor = conn.cursor()
         results = cursor.execute(
-            "SELECT * FROM bookings ORDER BY booking_id DESC LIMIT ? OFFSET ?",
+            f"SELECT {_BOOKING_COLUMNS} FROM bookings ORDER BY booking_id DESC LIMIT ? OFFSET ?",
             (limit, offset)
         ).fetchall()
-        return [Booking(**dict(row)) for row in results]
+        # rows come from our own schema, so skip re-validating every field on the way out
+        return [Booking.model_construct(**dict(row)) for row in results]
+
+_SQL_INSERT_BOOKING_HISTORY = "INSERT INTO booking_history (booking_id, pnr, event_type, timestamp, details) VALUES (?, ?, ?, ?, ?)"
 
-@app.delete("/bookings/{booking_id}")
+@app.delete("/bookings/{booking_id:int}")
 async def cancel_persisted_booking(booking_id: int):
     """Cancel a persisted booking: mark as cancelled and release seats back to flights_db."""
+    cancelled_at = datetime.now().isoformat()
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        row = cursor.execute("SELECT * FROM bookings WHERE booking_id = ?", (booking_id,)).fetchone()
+        # status change and history event commit together (one WAL sync instead of two)
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT * FROM bookings WHERE booking_id = ?", (booking_id,)).fetchone()
         if row is None:
             raise HTTPException(status_code=404, detail=f"Booking {booking_id} not found")
         booking = dict(row)
         if booking.get("status") == "cancelled":
             return {"booking_id": booking_id, "status": "already_cancelled"}
 
-        # update DB status
-        cursor.execute("UPDATE bookings SET status = ? WHERE booking_id = ?", ("cancelled", booking_id))
-        conn.commit()
+        seats = int(booking.get("seats", 0))
+        # simulate refund: currently full refund of the booking price (could be prorated in future)
+        refund_amount = float(booking.get("price") or 0.0)
 
-    # release seats in DB (transactional) and in-memory flights_db if matching flight exists
-    flight_id = booking.get("flight_id")
-    seats = int(booking.get("seats", 0))
-    ok, err = release_seats(flight_id, seats)
-    if not ok:
-        # if DB release failed (e.g. flight not present), still try to release in-memory
-        flight = next((f for f in flights_db if f.get("flight_id") == flight_id), None)
-        if flight:
-            flight["seats_available"] = flight.get("seats_available", 0) + seats
-    else:
-        # DB updated; keep in-memory in sync
-        flight = next((f for f in flights_db if f.get("flight_id") == flight_id), None)
-        if flight:
-            flight["seats_available"] = flight.get("seats_available", 0) + seats
-
-    # simulate refund: currently full refund of the booking price (could be prorated in future)
-    refund_amount = float(booking.get("price") or 0.0)
-
-    # record cancellation event in booking_history
-    try:
-        with get_db_connection() as conn:
+        # update DB status
+        conn.execute("UPDATE bookings SET status = ? WHERE booking_id = ?", ("cancelled", booking_id))
+        # record cancellation event in booking_history
+        try:
             conn.execute(
-                "INSERT INTO booking_history (booking_id, pnr, event_type, timestamp, details) VALUES (?, ?, ?, ?, ?)",
+                _SQL_INSERT_BOOKING_HISTORY,
                 (
                     booking_id,
                     booking.get("pnr"),
                     "cancelled",
-                    datetime.now().isoformat(),
+                    cancelled_at,
                     json.dumps({"seats_released": seats, "refund_amount": refund_amount}),
                 ),
             )
-            conn.commit()
-    except Exception:
-        # non-fatal: history recording failed
-        pass
+        except sqlite3.Error:
+            # non-fatal: history recording failed
+            pass
+        conn.commit()
+
+    # release seats in DB (transactional) and in-memory flights_db if matching flight exists
+    flight_id = booking.get("flight_id")
+    release_seats(flight_id, seats)
+    # whether or not the DB release succeeded (e.g. flight not present), release in-memory too
+    flight = flights_by_id.get(flight_id)
+    if flight:
+        with _seats_lock:
+            flight["seats_available"] = flight.get("seats_available", 0) + seats
+    invalidate_flights_cache()
 
     return {"booking_id": booking_id, "status": "cancelled", "seats_released": seats, "refund_amount": refund_amount}
 
 
-@app.patch("/bookings/{booking_id}", response_model=Booking)
-async def update_persisted_booking(booking_id: int, update: Booking):
-    """Basic update: allows updating passenger info and status (except booking_id)."""
+class BulkCancelRequest(BaseModel):
+    booking_ids: List[int]
+
+@app.post("/bookings/cancel_bulk")
+async def cancel_persisted_bookings_bulk(req: BulkCancelRequest):
+    """Cancel several persisted bookings in a single transaction.
+    Unknown or already-cancelled ids are reported back rather than failing the batch.
+    """
+    booking_ids = list(dict.fromkeys(req.booking_ids))
+    if not booking_ids:
+        return {"cancelled": [], "already_cancelled": [], "not_found": []}
+    placeholders = ", ".join("?" * len(booking_ids))
+    now = datetime.now().isoformat()
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        row = cursor.execute("SELECT * FROM bookings WHERE booking_id = ?", (booking_id,)).fetchone()
-        if row is None:
-            raise HTTPException(status_code=404, detail=f"Booking {booking_id} not found")
-        current = dict(row)
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(f"SELECT * FROM bookings WHERE booking_id IN ({placeholders})", booking_ids).fetchall()
+        found = {row["booking_id"]: dict(row) for row in rows}
+        to_cancel = [b for b in found.values() if b.get("status") != "cancelled"]
+        conn.executemany(
+            "UPDATE bookings SET status = 'cancelled' WHERE booking_id = ?",
+            [(b["booking_id"],) for b in to_cancel],
+        )
+        try:
+            conn.executemany(
+                _SQL_INSERT_BOOKING_HISTORY,
+                [
+                    (
+                        b["booking_id"],
+                        b.get("pnr"),
+                        "cancelled",
+                        now,
+                        json.dumps({"seats_released": int(b.get("seats", 0)), "refund_amount": float(b.get("price") or 0.0)}),
+                    )
+                    for b in to_cancel
+                ],
+            )
+        except sqlite3.Error:
+            # non-fatal: history recording failed
+            pass
+        conn.commit()
+
+    # one seat release per flight rather than per booking
+    seats_by_flight = defaultdict(int)
+    for b in to_cancel:
+        seats_by_flight[b.get("flight_id")] += int(b.get("seats", 0))
+    for flight_id, seats in seats_by_flight.items():
+        release_seats(flight_id, seats)
+        flight = flights_by_id.get(flight_id)
+        if flight:
+            with _seats_lock:
+                flight["seats_available"] = flight.get("seats_available", 0) + seats
+    invalidate_flights_cache()
+
+    return {
+        "cancelled": [
+            {"booking_id": b["booking_id"], "seats_released": int(b.get("seats", 0)), "refund_amount": float(b.get("price") or 0.0)}
+            for b in to_cancel
+        ],
+        "already_cancelled": [b["booking_id"] for b in found.values() if b.get("status") == "cancelled"],
+        "not_found": [i for i in booking_ids if i not in found],
+    }
 
-        # prepare values to update; only allow specific fields
-        allowed = {"passenger_name", "passenger_email", "passenger_phone", "status"}
-        updates = {}
-        for field in allowed:
-            val = getattr(update, field, None)
-            if val is not None:
-                updates[field] = val
 
+@app.patch("/bookings/{booking_id:int}", response_model=Booking)
+async def update_persisted_booking(booking_id: int, update: Booking):
+    """Basic update: allows updating passenger info and status (except booking_id)."""
+    # prepare values to update; only allow specific fields
+    allowed = {"passenger_name", "passenger_email", "passenger_phone", "status"}
+    updates = {}
+    for field in allowed:
+        val = getattr(update, field, None)
+        if val is not None:
+            updates[field] = val
+
+    with get_db_connection() as conn:
         if updates:
             set_clause = ", ".join([f"{k} = ?" for k in updates.keys()])
             params = list(updates.values()) + [booking_id]
-            cursor.execute(f"UPDATE bookings SET {set_clause} WHERE booking_id = ?", params)
+            # RETURNING yields the updated row (or nothing for an unknown id), so no
+            # SELECT is needed before or after; fetchall() steps the statement to completion
+            rows = conn.execute(f"UPDATE bookings SET {set_clause} WHERE booking_id = ? RETURNING *", params).fetchall()
             conn.commit()
-
-        row = cursor.execute("SELECT * FROM bookings WHERE booking_id = ?", (booking_id,)).fetchone()
+            row = rows[0] if rows else None
+        else:
+            row = conn.execute("SELECT * FROM bookings WHERE booking_id = ?", (booking_id,)).fetchone()
+        if row is None:
+            raise HTTPException(status_code=404, detail=f"Booking {booking_id} not found")
         return Booking(**dict(row))
     
 class Flight(BaseModel):
@@ -752,14 +1096,6 @@ def create_passenger(passenger: Passenger):
         "data" : passenger
     } 
 
-@app.post("/bookings")
-def create_booking(booking: BookingRequest):
-    return {
-        "message": "Booking created successfully",
-        "booking_details": booking,
-        "booking_id": 1001
-    }  
-
 @app.post("/bookings/create_with_pnr")
 def create_booking_with_pnr(booking: BookingRequest):
     PNR = "PNR" + "98735463273"
@@ -890,7 +1226,26 @@ flights_db= [
         "seats_available": 45
     }
 ]
-bookings_db= []
+# flight_id -> the same dict held in flights_db, so seat updates are visible through both
+flights_by_id = {f["flight_id"]: f for f in flights_db}
+# (origin, destination) lower-cased -> flights on that route, in flights_db order
+flights_by_route = defaultdict(list)
+for _flight in flights_db:
+    flights_by_route[(_flight["origin"].lower(), _flight["destination"].lower())].append(_flight)
+# guards read-modify-write of seats_available on the in-memory flights; the sync
+# endpoints run on the threadpool, so two requests can otherwise interleave
+_seats_lock = threading.Lock()
+# seat counts as seeded above, for reset_seats
+_SEED_SEATS = {f["flight_id"]: f["seats_available"] for f in flights_db}
+
+def reset_seats():
+    """Put every in-memory flight back to its seeded seat count (used by the tests)."""
+    with _seats_lock:
+        for flight_id, seats in _SEED_SEATS.items():
+            flights_by_id[flight_id]["seats_available"] = seats
+    invalidate_flights_cache()
+# in-memory bookings in creation order, keyed by upper-cased PNR
+bookings_db: "OrderedDict[str, dict]" = OrderedDict()
 booking_counter= 1000
 
 # Models and helpers for multi-step booking flow
@@ -917,20 +1272,41 @@ def _generate_pnr() -> str:
     return f"TMP{booking_counter}"
 
 
-def _generate_final_pnr(length: int = 6) -> str:
-    """Generate a random alphanumeric PNR of given length."""
-    alphabet = string.ascii_uppercase + string.digits
-    return ''.join(secrets.choice(alphabet) for _ in range(length))
-
+_PNR_ALPHABET = string.ascii_uppercase + string.digits
 
-def generate_unique_pnr(db_conn_getter=get_db_connection, length: int = 6, max_attempts: int = 50) -> str:
+def _generate_final_pnr(length: int = 6) -> str:
+    """Generate a random alphanumeric PNR of given length, starting with a letter."""
+    # a single CSPRNG draw spelled out in base 36, rather than one secrets.choice per
+    # character. The first character is a letter: an all-digit PNR would be routed to
+    # DELETE /bookings/{booking_id:int} instead of cancel_booking
+    letters = len(string.ascii_uppercase)
+    n = secrets.randbelow(letters * len(_PNR_ALPHABET) ** (length - 1))
+    n, r = divmod(n, letters)
+    chars = [_PNR_ALPHABET[r]]
+    for _ in range(length - 1):
+        n, r = divmod(n, len(_PNR_ALPHABET))
+        chars.append(_PNR_ALPHABET[r])
+    return ''.join(chars)
+
+
+# candidates checked per query in generate_unique_pnr
+_PNR_BATCH_SIZE = 16
+_SQL_TAKEN_PNRS = f"SELECT pnr FROM bookings WHERE pnr IN ({', '.join('?' * _PNR_BATCH_SIZE)})"
+
+# random PNRs tried by booking_flow_pay before falling back to generate_unique_pnr
+_PNR_INSERT_ATTEMPTS = 5
+
+def generate_unique_pnr(db_conn_getter=get_reader, length: int = 6, max_attempts: int = 50) -> str:
     """Generate a PNR and ensure it is unique in the bookings table."""
-    for _ in range(max_attempts):
-        candidate = _generate_final_pnr(length)
-        with db_conn_getter() as conn:
-            row = conn.execute("SELECT 1 FROM bookings WHERE pnr = ?", (candidate,)).fetchone()
-            if row is None:
-                return candidate
+    # one pooled read connection serves every attempt, and each query checks a
+    # whole batch of candidates against the unique pnr index
+    with db_conn_getter() as conn:
+        for _ in range(-(-max_attempts // _PNR_BATCH_SIZE)):
+            candidates = [_generate_final_pnr(length) for _ in range(_PNR_BATCH_SIZE)]
+            taken = {row[0] for row in conn.execute(_SQL_TAKEN_PNRS, candidates)}
+            for candidate in candidates:
+                if candidate not in taken:
+                    return candidate
     # fallback to a longer PNR using timestamp/secret
     return f"PNR{int(time.time())}{secrets.token_hex(3).upper()}"
 
@@ -943,37 +1319,44 @@ def booking_flow_start(req: StartBookingRequest):
     if db_flight:
         if req.seats <= 0:
             raise HTTPException(status_code=400, detail="seats must be >= 1")
-        if int(db_flight.get("seats_available", 0)) < req.seats:
-            raise HTTPException(status_code=400, detail="Not enough seats available")
 
+        # reserve_seats is a single conditional UPDATE, so it is also the seat check;
+        # checking the snapshot first would only race with concurrent bookings
         ok, err = reserve_seats(req.flight_id, req.seats)
         if not ok:
+            if err == "not enough seats":
+                raise HTTPException(status_code=400, detail="Not enough seats available")
             raise HTTPException(status_code=400, detail=f"Unable to reserve seats: {err}")
 
         # reflect change in in-memory flights_db for UI endpoints
-        flight = next((f for f in flights_db if f.get("flight_id") == req.flight_id), None)
+        flight = flights_by_id.get(req.flight_id)
         if flight:
-            flight["seats_available"] = max(0, flight.get("seats_available", 0) - req.seats)
+            with _seats_lock:
+                flight["seats_available"] = max(0, flight.get("seats_available", 0) - req.seats)
 
         # compute price using DB seat snapshot
-        price_info = compute_dynamic_price(base_price=float(db_flight.get("price") or 0.0), seats_available=int(db_flight.get("seats_available", 0)) - req.seats)
+        price_info = compute_dynamic_price(base_price=db_flight.price or 0.0, seats_available=db_flight.seats_available - req.seats, return_breakdown=False)
         total_price = price_info["final_price"] * req.seats
     else:
         # fallback to in-memory reservation
-        flight = next((f for f in flights_db if f.get("flight_id") == req.flight_id), None)
+        flight = flights_by_id.get(req.flight_id)
         if flight is None:
             raise HTTPException(status_code=404, detail=f"Flight {req.flight_id} not found")
         if req.seats <= 0:
             raise HTTPException(status_code=400, detail="seats must be >= 1")
-        if flight.get("seats_available", 0) < req.seats:
-            raise HTTPException(status_code=400, detail="Not enough seats available")
+        # check and reserve under one lock so concurrent bookings can't both take the last seats
+        with _seats_lock:
+            if flight.get("seats_available", 0) < req.seats:
+                raise HTTPException(status_code=400, detail="Not enough seats available")
 
-        # compute price (use existing dynamic pricing if available)
-        price_info = compute_dynamic_price(base_price=float(flight.get("price") or 0.0), seats_available=int(flight.get("seats_available", 0)))
-        total_price = price_info["final_price"] * req.seats
+            # compute price (use existing dynamic pricing if available)
+            price_info = compute_dynamic_price(base_price=float(flight.get("price") or 0.0), seats_available=int(flight.get("seats_available", 0)), return_breakdown=False)
+            total_price = price_info["final_price"] * req.seats
 
-        # reserve seats in-memory
-        flight["seats_available"] = max(0, flight.get("seats_available", 0) - req.seats)
+            # reserve seats in-memory
+            flight["seats_available"] = max(0, flight.get("seats_available", 0) - req.seats)
+
+    invalidate_flights_cache()
 
     pnr = _generate_pnr()
     temp = {
@@ -985,13 +1368,13 @@ def booking_flow_start(req: StartBookingRequest):
         "status": "reserved",
         "passenger": None,
     }
-    bookings_db.append(temp)
+    bookings_db[pnr] = temp
     return TempBookingResponse(pnr=pnr, flight_id=req.flight_id, seats=req.seats, total_price=total_price, status="reserved")
 
 
 @app.post("/booking_flow/{pnr}/passenger")
 def booking_flow_passenger(pnr: str, passenger: Passenger):
-    tb = next((b for b in bookings_db if b.get("pnr") == pnr.upper() or b.get("pnr") == pnr), None)
+    tb = bookings_db.get(pnr.upper())
     if tb is None:
         raise HTTPException(status_code=404, detail=f"Temporary booking {pnr} not found")
     # use Pydantic v2 API .model_dump() instead of deprecated .dict()
@@ -1002,48 +1385,67 @@ def booking_flow_passenger(pnr: str, passenger: Passenger):
 
 @app.post("/booking_flow/{pnr}/pay")
 def booking_flow_pay(pnr: str, payment: PaymentRequest):
-    tb = next((b for b in bookings_db if b.get("pnr") == pnr.upper() or b.get("pnr") == pnr), None)
+    tb = bookings_db.get(pnr.upper())
     if tb is None:
         raise HTTPException(status_code=404, detail=f"Temporary booking {pnr} not found")
     if tb.get("status") == "confirmed":
         return {"pnr": tb["pnr"], "status": "already_confirmed"}
+    if tb.get("seats_released"):
+        # a failed payment gave the seats back; paying again would release them twice
+        # or confirm a booking that holds no seats
+        raise HTTPException(status_code=400, detail=f"Payment for booking {pnr} already failed; start a new booking")
 
     # simulate payment
-    if random.random() < payment.fail_rate:
-        # payment failed: release seats
-        # try to release via DB if present
-        ok, err = release_seats(tb.get("flight_id"), tb.get("seats", 0))
-        if not ok:
-            # fallback to in-memory release if DB release failed or flight not present
-            flight = next((f for f in flights_db if f.get("flight_id") == tb.get("flight_id")), None)
-            if flight:
+    if _simulated_failure(payment.fail_rate):
+        # payment failed: release seats in the DB if the flight is there, and always
+        # in flights_by_id, which booking_flow_start decremented on both paths
+        release_seats(tb.get("flight_id"), tb.get("seats", 0))
+        flight = flights_by_id.get(tb.get("flight_id"))
+        if flight:
+            with _seats_lock:
                 flight["seats_available"] = flight.get("seats_available", 0) + tb.get("seats", 0)
+            invalidate_flights_cache()
         tb["status"] = "failed"
+        tb["seats_released"] = True
         return {"pnr": tb["pnr"], "status": "payment_failed"}
 
     # payment succeeded: persist to SQLite bookings table
-    # generate unique final PNR and persist
-    final_pnr = generate_unique_pnr()
-    tb["pnr"] = final_pnr
-    with get_db_connection() as conn:
+    # bookings.pnr is UNIQUE, so instead of checking a fresh PNR first we insert it
+    # directly and only draw another one on the (very rare) collision
+    passenger = tb.get("passenger")
+    if passenger:
+        passenger_name = passenger.get("full_name")
+        passenger_email = passenger.get("passport_no")
+        passenger_phone = str(passenger.get("phone"))
+    else:
+        passenger_name = passenger_email = passenger_phone = ""
+    with get_writer() as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO bookings
-            (pnr, flight_id, passenger_name, passenger_email, passenger_phone, seats, status, price)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            final_pnr,
-            tb.get("flight_id"),
-            tb.get("passenger", {}).get("full_name") if tb.get("passenger") else "",
-            tb.get("passenger", {}).get("passport_no") if tb.get("passenger") else "",
-            str(tb.get("passenger", {}).get("phone")) if tb.get("passenger") else "",
-            tb.get("seats"),
-            "confirmed",
-            tb.get("total_price")
-        ))
+        for attempt in range(_PNR_INSERT_ATTEMPTS):
+            final_pnr = _generate_final_pnr() if attempt < _PNR_INSERT_ATTEMPTS - 1 else generate_unique_pnr()
+            try:
+                cursor.execute(_SQL_INSERT_BOOKING, (
+                    final_pnr,
+                    tb.get("flight_id"),
+                    passenger_name,
+                    passenger_email,
+                    passenger_phone,
+                    tb.get("seats"),
+                    "confirmed",
+                    tb.get("total_price")
+                ))
+                break
+            except sqlite3.IntegrityError as e:
+                if "bookings.pnr" not in str(e) or attempt == _PNR_INSERT_ATTEMPTS - 1:
+                    raise
         conn.commit()
         booking_id = cursor.lastrowid
 
+    # the booking is now found under its final PNR instead of the temporary one
+    bookings_db.pop(tb["pnr"], None)
+    tb["pnr"] = final_pnr
+    bookings_db[final_pnr] = tb
+
     tb["status"] = "confirmed"
     tb["booking_id"] = booking_id
     return {"pnr": tb["pnr"], "status": "confirmed", "booking_id": booking_id}
@@ -1051,7 +1453,7 @@ def booking_flow_pay(pnr: str, payment: PaymentRequest):
 
 @app.get("/booking_flow/{pnr}")
 def booking_flow_status(pnr: str):
-    tb = next((b for b in bookings_db if b.get("pnr") == pnr.upper() or b.get("pnr") == pnr), None)
+    tb = bookings_db.get(pnr.upper())
     if tb is None:
         raise HTTPException(status_code=404, detail=f"Temporary booking {pnr} not found")
     return tb
@@ -1066,102 +1468,55 @@ def health_check():
 
 @app.delete("/bookings/{pnr}")
 def cancel_booking(pnr : str):
-    for i, booking in enumerate(bookings_db):
-        if booking["pnr"] == pnr.upper():
-            for flights in flights_db:
-                if flights.get("flight_id") == booking.get("flight_id"):
-                   flights["seats_available"] += 1
-                break
-            cancel= bookings_db.pop(i)
-            return {
-                "message": "Booking cancelled successfully",
-                "cancelled_booking": cancel
-            }
-    raise HTTPException(status_code=404, detail=f"Booking with PNR {pnr} not found")
+    booking = bookings_db.pop(pnr.upper(), None)
+    if booking is None:
+        raise HTTPException(status_code=404, detail=f"Booking with PNR {pnr} not found")
+    # seats a failed payment already gave back are not released twice
+    flight = flights_by_id.get(booking.get("flight_id"))
+    if flight and not booking.get("seats_released"):
+        with _seats_lock:
+            flight["seats_available"] += booking.get("seats", 1)
+    invalidate_flights_cache()
+    return {
+        "message": "Booking cancelled successfully",
+        "cancelled_booking": booking
+    }
 
 @app.get("/flights/{flight_id}/fare-history")
 def get_fare_history(
     flight_id: str,
+    request: Request,
     hours: int = Query(24, description="Hours of history to return", ge=1, le=168),
     include_breakdown: bool = Query(False, description="Include price calculation breakdown in results"),
 ) -> FareHistory:
     if flight_id not in fare_history:
         raise HTTPException(status_code=404, detail=f"No fare history found for flight {flight_id}")
-    cutoff = datetime.now() - timedelta(hours=hours)
-    history = [
-        point for point in fare_history[flight_id]
-        if point.timestamp >= cutoff
-    ]
+    history = _recent_fare_points(flight_id, hours)
     if not include_breakdown:
-        for point in history:
-            point.breakdown = None
-    if history:
-        prices = [p.price for p in history]
-        demands = [p.demand_level for p in history]
-        seats = [p.seats_available for p in history]
-        analytics = {
-            "price": {
-                "min": min(prices),
-                "max": max(prices),
-                "avg": round(mean(prices), 2),
-                "median": round(median(prices), 2),
-            },
-            "demand": {
-                "min": min(demands),
-                "max": max(demands),
-                "avg": round(mean(demands), 3),
-            },
-            "seats_available": {
-                "min": min(seats),
-                "max": max(seats),
-                "last": seats[-1],
-            },
-            "total_changes": len(history),
-            "period_hours": hours,
-        }
-    else:
-        analytics = None
-    return FareHistory(
+        # shallow copies: the stored points keep their breakdown for later requests
+        history = [point.model_copy(update={"breakdown": None}) for point in history]
+    analytics = _cached_fare_analytics(flight_id, ("fare-history", hours), lambda: _fare_analytics(history, hours))
+    # clients may reuse it until the simulation's next demand update
+    return _cacheable_json(request, FareHistory(
         flight_id=flight_id,
         history=history,
         analytics=analytics
-    )
+    ), demand_simulation["update_interval"])
 
 @app.get("/flights/{flight_id}/price-alerts")
 def get_price_alerts(
     flight_id: str,
+    request: Request,
     threshold_percent: float = Query(10.0, description="Alert threshold percentage", ge=0.1),
     hours: int = Query(24, description="Hours to analyze", ge=1, le=168),
 ):
     if flight_id not in fare_history:
         raise HTTPException(status_code=404, detail=f"No fare history found for flight {flight_id}")
-    cutoff = datetime.now() - timedelta(hours=hours)
-    history = [
-        point for point in fare_history[flight_id]
-        if point.timestamp >= cutoff
-    ]
-    if not history:
-        return {"alerts": [], "threshold_percent": threshold_percent}
-    alerts = []
-    baseline = history[0].price
-    for i, point in enumerate(history[1:], 1):
-        pct_change = ((point.price - baseline) / baseline) * 100
-        if abs(pct_change) >= threshold_percent:
-            alerts.append({
-                "timestamp": point.timestamp,
-                "old_price": baseline,
-                "new_price": point.price,
-                "percent_change": round(pct_change, 2),
-                "demand_level": point.demand_level,
-                "seats_available": point.seats_available
-            })
-            baseline = point.price
-    return {
-        "alerts": alerts,
-        "threshold_percent": threshold_percent,
-        "total_changes": len(history) - 1,
-        "significant_changes": len(alerts)
-    }
+    alerts = _cached_fare_analytics(
+        flight_id, ("price-alerts", hours, threshold_percent),
+        lambda: _price_alerts(_recent_fare_points(flight_id, hours), threshold_percent),
+    )
+    return _cacheable_json(request, alerts, demand_simulation["update_interval"])
 
 @app.post("/simulation/start")
 async def start_simulation(background_tasks: BackgroundTasks):
@@ -1177,57 +1532,56 @@ async def get_simulation_status():
         "is_running": demand_simulation["is_running"],
         "last_update": demand_simulation["last_update"].isoformat() if demand_simulation["last_update"] else None,
         "update_interval_seconds": demand_simulation["update_interval"],
-        "demand_levels": demand_simulation["current_demand_levels"],
+        "demand_levels": current_demand_levels,
     }
 def get_flight_demand(flight_id: str) -> float:
-    return demand_simulation["current_demand_levels"].get(flight_id, 0.5)
-def compute_dynamic_price(
+    return current_demand_levels.get(flight_id, 0.5)
+# dynamic prices never drop below this fraction of the base price
+MIN_PRICE_FACTOR = 0.8
+
+_DEFAULT_PRICING_TIERS = {
+    10: 2.0,
+    20: 1.5,
+    50: 1.2,
+    100: 1.0,
+}
+# sorted once here; only custom tier tables are sorted per call
+_DEFAULT_TIERS_SORTED = tuple(sorted(_DEFAULT_PRICING_TIERS.items()))
+
+@functools.lru_cache(maxsize=256)
+def _parse_travel_date(travel_date: str) -> date:
+    try:
+        return date.fromisoformat(travel_date)
+    except Exception:
+        return datetime.fromisoformat(travel_date).date()
+
+def _sorted_tiers(tiers: dict) -> tuple:
+    """Normalize a pricing tier dict to sorted (threshold, multiplier) pairs.
+    The tuple is hashable, so it doubles as the cache key for custom tiers;
+    tiers that don't convert fall back to the defaults.
+    """
+    try:
+        return tuple(sorted((int(k), float(v)) for k, v in tiers.items()))
+    except Exception:
+        return _DEFAULT_TIERS_SORTED
+
+def _price_components(
     base_price: float,
     seats_available: int,
-    total_seats: int | None = None,
-    travel_date: str | None = None,
-    demand_level: float = 0.0,
-    pricing_tiers: dict | None = None,
-):    
-    if base_price <= 0:
-        raise ValueError("base_price must be > 0")
-    if seats_available < 0:
-        raise ValueError("seats_available must be >= 0")
-    if total_seats is None:
-        total_seats = 100
-    if total_seats <= 0:
-        raise ValueError("total_seats must be > 0")
-    if seats_available > total_seats:
-        seats_available = total_seats
-    demand_level = max(0.0, min(1.0, float(demand_level)))
+    total_seats: int,
+    days_until: int | None,
+    demand_level: float,
+    sorted_thresholds: tuple,
+) -> tuple:
+    """Pure pricing math behind compute_dynamic_price; inputs are already validated.
+    Returns (final_price, tier_multiplier, time_multiplier, demand_multiplier,
+    combined_multiplier, raw_price, min_price, max_price, seats_remaining_pct),
+    with the breakdown values rounded as they are reported.
+    """
     seats_remaining_pct = (seats_available / total_seats) * 100.0
-    default_tiers = {
-        10: 2.0,   
-        20: 1.5,   
-        50: 1.2,   
-        100: 1.0,  
-    }
-    tiers = pricing_tiers or default_tiers
-    tier_multiplier = 1.0
-    try:
-        sorted_thresholds = sorted((int(k), float(v)) for k, v in tiers.items())
-    except Exception:
-        sorted_thresholds = sorted((int(k), float(v)) for k, v in default_tiers.items())
-    for thresh, mult in sorted_thresholds:
-        if seats_remaining_pct <= thresh:
-            tier_multiplier = mult
-            break
-    days_until = None
-    if travel_date:
-        try:
-            dep_date = date.fromisoformat(travel_date)
-        except Exception:
-            dep_date = datetime.fromisoformat(travel_date).date()
-        today = date.today()
-        delta_days = (dep_date - today).days
-        days_until = delta_days
-    else:
-        days_until = None
+    # first tier whose threshold is >= the remaining percentage
+    i = bisect_left(sorted_thresholds, seats_remaining_pct, key=itemgetter(0))
+    tier_multiplier = sorted_thresholds[i][1] if i < len(sorted_thresholds) else 1.0
     if days_until is None:
         time_multiplier = 1.0
     elif days_until > 30:
@@ -1240,35 +1594,133 @@ def compute_dynamic_price(
         time_multiplier = 1.5
     demand_multiplier = 1.0 + (0.5 * demand_level)
     combined_multiplier = tier_multiplier * time_multiplier * demand_multiplier
-    min_price = base_price * 0.8
+    min_price = base_price * MIN_PRICE_FACTOR
     max_price = base_price * 3.0
     raw_price = base_price * combined_multiplier
     final_price = round(max(min_price, min(max_price, raw_price)), 2)
+    return (
+        final_price,
+        tier_multiplier,
+        time_multiplier,
+        round(demand_multiplier, 3),
+        round(combined_multiplier, 3),
+        round(raw_price, 2),
+        round(min_price, 2),
+        round(max_price, 2),
+        round(seats_remaining_pct, 2),
+    )
+
+@functools.lru_cache(maxsize=4096)
+def _default_price_components(
+    base_price: float,
+    seats_available: int,
+    total_seats: int,
+    days_until: int | None,
+    demand_level: float,
+) -> tuple:
+    # every caller in this module uses the default tiers, so this is the memoized path;
+    # the key uses days_until rather than travel_date so entries stay correct across midnight
+    return _price_components(base_price, seats_available, total_seats, days_until, demand_level, _DEFAULT_TIERS_SORTED)
+
+@functools.lru_cache(maxsize=1024)
+def _custom_price_components(
+    base_price: float,
+    seats_available: int,
+    total_seats: int,
+    days_until: int | None,
+    demand_level: float,
+    tiers_key: tuple,
+) -> tuple:
+    return _price_components(base_price, seats_available, total_seats, days_until, demand_level, tiers_key)
+
+def _price_info(base_price: float, seats_available: int, total_seats: int, demand_level: float, components: tuple, return_breakdown: bool = True) -> dict:
+    if not return_breakdown:
+        return {"final_price": components[0], "breakdown": None, "demand_level": demand_level}
+    final_price, tier_multiplier, time_multiplier, demand_multiplier, combined_multiplier, raw_price, min_price, max_price, seats_remaining_pct = components
+    # the breakdown is built per call so callers may keep or modify it without touching the cache
     breakdown = {
         "base_price": base_price,
         "seats_available": seats_available,
         "total_seats": total_seats,
-        "seats_remaining_percentage": round(seats_remaining_pct, 2),
+        "seats_remaining_percentage": seats_remaining_pct,
         "tier_multiplier": tier_multiplier,
         "time_multiplier": time_multiplier,
-        "demand_multiplier": round(demand_multiplier, 3),
-        "combined_multiplier": round(combined_multiplier, 3),
-        "raw_price": round(raw_price, 2),
-        "min_price": round(min_price, 2),
-        "max_price": round(max_price, 2),
+        "demand_multiplier": demand_multiplier,
+        "combined_multiplier": combined_multiplier,
+        "raw_price": raw_price,
+        "min_price": min_price,
+        "max_price": max_price,
     }
     return {"final_price": final_price, "breakdown": breakdown, "demand_level": demand_level}
 
+def compute_dynamic_price(
+    base_price: float,
+    seats_available: int,
+    total_seats: int | None = None,
+    travel_date: str | None = None,
+    demand_level: float = 0.0,
+    pricing_tiers: dict | None = None,
+    return_breakdown: bool = True,
+):
+    if base_price <= 0:
+        raise ValueError("base_price must be > 0")
+    if seats_available < 0:
+        raise ValueError("seats_available must be >= 0")
+    if total_seats is None:
+        total_seats = 100
+    if total_seats <= 0:
+        raise ValueError("total_seats must be > 0")
+    if seats_available > total_seats:
+        seats_available = total_seats
+    # quantized to 2 decimals so the simulated demand levels share cache entries
+    demand_level = round(max(0.0, min(1.0, float(demand_level))), 2)
+    days_until = (_parse_travel_date(travel_date) - date.today()).days if travel_date else None
+    if pricing_tiers:
+        components = _custom_price_components(base_price, seats_available, total_seats, days_until, demand_level, _sorted_tiers(pricing_tiers))
+    else:
+        components = _default_price_components(base_price, seats_available, total_seats, days_until, demand_level)
+    return _price_info(base_price, seats_available, total_seats, demand_level, components, return_breakdown)
+
+def compute_dynamic_prices(
+    flights: list[dict],
+    travel_date: str | None = None,
+    demand_level: float | None = None,
+    return_breakdown: bool = True,
+) -> list[tuple[dict, dict]]:
+    """Price a batch of flights with the default tiers and 100 total seats.
+    The travel date and demand override are resolved once for the whole batch
+    rather than per flight. Returns (flight, price_info) pairs; flights that
+    compute_dynamic_price would reject are left out.
+    """
+    days_until = (_parse_travel_date(travel_date) - date.today()).days if travel_date else None
+    if demand_level is not None:
+        demand_level = round(max(0.0, min(1.0, float(demand_level))), 2)
+    priced = []
+    demand_of = current_demand_levels.get
+    for flight in flights:
+        base_price = float(flight.get("price") or 0.0)
+        seats_available = int(flight.get("seats_available", 0))
+        if base_price <= 0 or seats_available < 0:
+            continue
+        seats_available = min(seats_available, 100)
+        level = demand_level
+        if level is None:
+            level = round(max(0.0, min(1.0, demand_of(flight.get("flight_id", ""), 0.5))), 2)
+        components = _default_price_components(base_price, seats_available, 100, days_until, level)
+        priced.append((flight, _price_info(base_price, seats_available, 100, level, components, return_breakdown)))
+    return priced
+
 
 @app.get("/flights/{flight_id}/price")
 def get_dynamic_price(
     flight_id: str,
+    request: Request,
     travel_date: str | None = None,
     demand_level: float = 0.0,
     base_price: float | None = None,
     total_seats: int | None = None,
 ): 
-    flight = next((f for f in flights_db if f.get("flight_id") == flight_id), None)
+    flight = flights_by_id.get(flight_id)
     if not flight:
         raise HTTPException(status_code=404, detail=f"Flight {flight_id} not found")
     bp = base_price if base_price is not None else float(flight.get("price") or 0.0)
@@ -1286,58 +1738,88 @@ def get_dynamic_price(
         seats_available=seats_avail,
         breakdown=result["breakdown"]
     )
-    return {"flight_id": flight_id, **result}
-def _generate_airline_a_schedules(origin: str | None, destination: str | None, date: str | None, limit: int) -> list:
-    items = []
-    for i in range(1, limit + 1):
-        items.append({
-            "flight_no": f"A-A{100 + i}",
-            "from": origin or "CityX",
-            "to": destination or "CityY",
-            "departure_time": f"2025-11-{(i%28)+1:02d}T0{(i%12)+1}:00:00Z",
-            "arrival_time": f"2025-11-{(i%28)+1:02d}T1{(i%12)+1}:00:00Z",
-            "duration": f"{6 + (i%3)}hours",
+    # every quote is recorded in the fare history above, so shared caches must not
+    # answer for this endpoint; an unchanged quote is still revalidated with a 304
+    return _cacheable_json(request, {"flight_id": flight_id, **result}, None)
+# the simulated providers are deterministic in their arguments, so each schedule
+# is built once and then served from the cache; the cached tuples and their items
+# are shared between requests and must not be modified
+# the provider endpoints cap limit at 50, so the per-item strings are formatted once
+# here (indexed by item number, 1-based) and the generators only build the dicts
+_SCHEDULE_ITEMS = range(51)
+_A_FLIGHT_NOS = tuple(f"A-A{100 + i}" for i in _SCHEDULE_ITEMS)
+_A_DEPARTURES = tuple(f"2025-11-{(i%28)+1:02d}T0{(i%12)+1}:00:00Z" for i in _SCHEDULE_ITEMS)
+_A_ARRIVALS = tuple(f"2025-11-{(i%28)+1:02d}T1{(i%12)+1}:00:00Z" for i in _SCHEDULE_ITEMS)
+_A_DURATIONS = tuple(f"{6 + (i%3)}hours" for i in _SCHEDULE_ITEMS)
+_B_IDS = tuple(f"B-B{200 + i}" for i in _SCHEDULE_ITEMS)
+_B_DEPARTURES = tuple(f"2025-11-{(i%28)+1:02d}T1{(i%12)+0}:30:00Z" for i in _SCHEDULE_ITEMS)
+_B_ARRIVALS = tuple(f"2025-11-{(i%28)+1:02d}T2{(i%12)+0}:30:00:00Z" for i in _SCHEDULE_ITEMS)
+
+@functools.lru_cache(maxsize=256)
+def _generate_airline_a_schedules(origin: str | None, destination: str | None, date: str | None, limit: int) -> tuple:
+    origin = origin or "CityX"
+    destination = destination or "CityY"
+    return tuple(
+        {
+            "flight_no": _A_FLIGHT_NOS[i],
+            "from": origin,
+            "to": destination,
+            "departure_time": _A_DEPARTURES[i],
+            "arrival_time": _A_ARRIVALS[i],
+            "duration": _A_DURATIONS[i],
             "price": 8000.0 + (i * 100),
             "seats": 50 - i
-        })
-    return items
-def _generate_airline_b_schedules(origin: str | None, destination: str | None, date: str | None, limit: int) -> list:
-    items = []
-    for i in range(1, limit + 1):
-        items.append({
-            "id": f"B-B{200 + i}",
-            "route": {"src": origin or "CityX", "dst": destination or "CityY"},
-            "dept": f"2025-11-{(i%28)+1:02d}T1{(i%12)+0}:30:00Z",
-            "arr": f"2025-11-{(i%28)+1:02d}T2{(i%12)+0}:30:00:00Z",
+        }
+        for i in range(1, limit + 1)
+    )
+@functools.lru_cache(maxsize=256)
+def _generate_airline_b_schedules(origin: str | None, destination: str | None, date: str | None, limit: int) -> tuple:
+    origin = origin or "CityX"
+    destination = destination or "CityY"
+    return tuple(
+        {
+            "id": _B_IDS[i],
+            "route": {"src": origin, "dst": destination},
+            "dept": _B_DEPARTURES[i],
+            "arr": _B_ARRIVALS[i],
             "duration_mins": 360 + (i * 10),
             "cost": 8200.0 + (i * 120),
             "available": 40 - i
-        })
-    return items
-def _normalize_to_internal_flight(item: dict, source: str) -> dict:
-    if source == "A":
-        return {
-            "flight_id": item.get("flight_no"),
-            "origin": item.get("from"),
-            "destination": item.get("to"),
-            "duration": item.get("duration"),
-            "price": float(item.get("price")) if item.get("price") is not None else None,
-            "seats_available": int(item.get("seats")) if item.get("seats") is not None else None
-        }
-    else:  
-        duration_mins = item.get("duration_mins")
-        duration_str = f"{duration_mins/60:.1f}hours" if duration_mins is not None else ""
-        return {
-            "flight_id": item.get("id"),
-            "origin": item.get("route", {}).get("src"),
-            "destination": item.get("route", {}).get("dst"),
-            "duration": duration_str,
-            "price": float(item.get("cost")) if item.get("cost") is not None else None,
-            "seats_available": int(item.get("available")) if item.get("available") is not None else None
         }
+        for i in range(1, limit + 1)
+    )
+def _normalize_a(item: dict) -> dict:
+    get = item.get
+    price = get("price")
+    seats = get("seats")
+    return {
+        "flight_id": get("flight_no"),
+        "origin": get("from"),
+        "destination": get("to"),
+        "duration": get("duration"),
+        "price": float(price) if price is not None else None,
+        "seats_available": int(seats) if seats is not None else None
+    }
 
-@app.get("/external/airline_a/schedules")
-async def external_airline_a_schedules(
+def _normalize_b(item: dict) -> dict:
+    get = item.get
+    route = get("route") or {}
+    duration_mins = get("duration_mins")
+    cost = get("cost")
+    available = get("available")
+    return {
+        "flight_id": get("id"),
+        "origin": route.get("src"),
+        "destination": route.get("dst"),
+        "duration": f"{duration_mins / 60:.1f}hours" if duration_mins is not None else "",
+        "price": float(cost) if cost is not None else None,
+        "seats_available": int(available) if available is not None else None
+    }
+
+# seconds a client may reuse a (successful) simulated provider response
+EXTERNAL_SCHEDULES_MAX_AGE = 30
+
+async def _airline_a_schedules(
     origin: str | None = None,
     destination: str | None = None,
     date: str | None = None,
@@ -1349,14 +1831,26 @@ async def external_airline_a_schedules(
         raise HTTPException(status_code=400, detail="limit must be between 1 and 50")
     if not (0.0 <= fail_rate <= 1.0):
         raise HTTPException(status_code=400, detail="fail_rate must be between 0.0 and 1.0")
-    if random.random() < fail_rate:
+    if _simulated_failure(fail_rate):
         raise HTTPException(status_code=503, detail="Airline A service unavailable (simulated)")
     if simulate_delay_ms > 0:
         await asyncio.sleep(simulate_delay_ms / 1000.0)
     return _generate_airline_a_schedules(origin, destination, date, limit)
 
-@app.get("/external/airline_b/schedules")
-async def external_airline_b_schedules(
+@app.get("/external/airline_a/schedules")
+async def external_airline_a_schedules(
+    request: Request,
+    origin: str | None = None,
+    destination: str | None = None,
+    date: str | None = None,
+    limit: int = 5,
+    simulate_delay_ms: int = 0,
+    fail_rate: float = 0.0,
+):
+    schedules = await _airline_a_schedules(origin, destination, date, limit, simulate_delay_ms, fail_rate)
+    return _cacheable_json(request, schedules, EXTERNAL_SCHEDULES_MAX_AGE)
+
+async def _airline_b_schedules(
     origin: str | None = None,
     destination: str | None = None,
     date: str | None = None,
@@ -1368,14 +1862,28 @@ async def external_airline_b_schedules(
         raise HTTPException(status_code=400, detail="limit must be between 1 and 50")
     if not (0.0 <= fail_rate <= 1.0):
         raise HTTPException(status_code=400, detail="fail_rate must be between 0.0 and 1.0")
-    if random.random() < fail_rate:
+    if _simulated_failure(fail_rate):
         raise HTTPException(status_code=503, detail="Airline B service unavailable (simulated)")
     if simulate_delay_ms > 0:
         await asyncio.sleep(simulate_delay_ms / 1000.0)
     return _generate_airline_b_schedules(origin, destination, date, limit)
 
+@app.get("/external/airline_b/schedules")
+async def external_airline_b_schedules(
+    request: Request,
+    origin: str | None = None,
+    destination: str | None = None,
+    date: str | None = None,
+    limit: int = 5,
+    simulate_delay_ms: int = 0,
+    fail_rate: float = 0.0,
+):
+    schedules = await _airline_b_schedules(origin, destination, date, limit, simulate_delay_ms, fail_rate)
+    return _cacheable_json(request, schedules, EXTERNAL_SCHEDULES_MAX_AGE)
+
 @app.get("/external/aggregate_schedules")
 async def external_aggregate_schedules(
+    request: Request,
     origin: str | None = None,
     destination: str | None = None,
     date: str | None = None,
@@ -1385,20 +1893,20 @@ async def external_aggregate_schedules(
     fail_rate_b: float = 0.0,
 ):
     tasks = [
-        external_airline_a_schedules(origin=origin, destination=destination, date=date, limit=limit_per_provider, simulate_delay_ms=simulate_delay_ms, fail_rate=fail_rate_a),
-        external_airline_b_schedules(origin=origin, destination=destination, date=date, limit=limit_per_provider, simulate_delay_ms=simulate_delay_ms, fail_rate=fail_rate_b),
+        _airline_a_schedules(origin=origin, destination=destination, date=date, limit=limit_per_provider, simulate_delay_ms=simulate_delay_ms, fail_rate=fail_rate_a),
+        _airline_b_schedules(origin=origin, destination=destination, date=date, limit=limit_per_provider, simulate_delay_ms=simulate_delay_ms, fail_rate=fail_rate_b),
     ]
     results = []
+    failed = False
     done = await asyncio.gather(*tasks, return_exceptions=True)
-    for idx, res in enumerate(done):
-        source = "A" if idx == 0 else "B"
+    for source, normalize, res in zip(("A", "B"), (_normalize_a, _normalize_b), done):
         if isinstance(res, Exception):
             results.append({"provider": source, "error": str(res)})
+            failed = True
             continue
-        for item in res:
-            norm = _normalize_to_internal_flight(item, source)
-            results.append(norm)
-    return results
+        results.extend(map(normalize, res))
+    # a partial result (a provider failed) should not be reused by clients
+    return _cacheable_json(request, results, 0 if failed else EXTERNAL_SCHEDULES_MAX_AGE)
 
 
 if __name__ == "__main__":
@@ -1415,4 +1923,4 @@ if __name__ == "__main__":
     )
     print(booking_example.json(indent=2))
 
-to run this code type fastapi dev main.py
+# to run this code type fastapi dev main.py
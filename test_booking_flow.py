@@ -1,205 +1,251 @@
-import os
-import os
-from fastapi.testclient import TestClient
-
-
-def setup_test_db(tmp_path):
-    # ensure database uses a temp file for tests
-    import database
-    dbfile = str(tmp_path / "test_flights.db")
-    database.set_database_file(dbfile)
-    # init db file
-    database.init_db()
-    return dbfile
-
-
-def test_happy_booking_flow(tmp_path):
-    # prepare test DB
-    dbfile = setup_test_db(tmp_path)
-
-    # import main after DB configured
-    import main as app_main
-    client = TestClient(app_main.app)
-
+import json
+import pytest
+
+# the in-memory test DB, the shared client and the per-test reset come from the
+# fixtures in conftest.py
+
+pytestmark = pytest.mark.anyio
+
+# passenger payloads; plain dicts so httpx can serialize them, and never modified
+PASSENGER_HAPPY = {
+    "full_name": "Test User",
+    "last_name": "User",
+    "age": 30,
+    "phone": 9000000000,
+    "passport_no": "P1234567"
+}
+PASSENGER_FAIL = {
+    "full_name": "Fail User",
+    "last_name": "User",
+    "age": 28,
+    "phone": 9111111111,
+    "passport_no": "P7654321"
+}
+PASSENGER_PNR = {
+    "full_name": "PNR Test",
+    "last_name": "User",
+    "age": 31,
+    "phone": 9001001001,
+    "passport_no": "PX11111"
+}
+PASSENGER_SEARCH = {
+    "full_name": "Search User",
+    "last_name": "Finder",
+    "age": 29,
+    "phone": 9002002002,
+    "passport_no": "S11111"
+}
+PASSENGER_TEMP_SEARCH = {
+    "full_name": "Temp Search",
+    "last_name": "Tester",
+    "age": 26,
+    "phone": 9003003003,
+    "passport_no": "TMP12345"
+}
+
+
+def _encode(payload):
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+# request bodies the HTTP tests send unchanged, encoded once and posted through
+# _post_json instead of letting httpx re-encode them on every call
+JSON_HEADERS = {"content-type": "application/json"}
+PASSENGER_HAPPY_JSON = _encode(PASSENGER_HAPPY)
+PASSENGER_FAIL_JSON = _encode(PASSENGER_FAIL)
+PASSENGER_TEMP_SEARCH_JSON = _encode(PASSENGER_TEMP_SEARCH)
+START_AI201_TWO_JSON = _encode({"flight_id": "AI-201", "seats": 2})
+START_AI202_ONE_JSON = _encode({"flight_id": "AI-202", "seats": 1})
+PAY_SUCCEED_JSON = _encode({"payment_method": "card", "fail_rate": 0.0})
+PAY_FAIL_JSON = _encode({"payment_method": "card", "fail_rate": 1.0})
+
+
+def _post_json(client, url, body):
+    return client.post(url, content=body, headers=JSON_HEADERS)
+
+
+def _confirm_booking(app_main, flight_id, passenger):
+    """Run start -> passenger -> pay (always succeeding) as direct handler calls.
+    Tests that only need a confirmed booking as setup use this; the HTTP path of
+    the flow itself is covered by test_booking_flow.
+    """
+    temp = app_main.booking_flow_start(app_main.StartBookingRequest(flight_id=flight_id, seats=1))
+    app_main.booking_flow_passenger(temp.pnr, app_main.Passenger(**passenger))
+    return app_main.booking_flow_pay(temp.pnr, app_main.PaymentRequest(payment_method="card", fail_rate=0.0))
+
+
+@pytest.mark.parametrize("flight_id,start,passenger,payment,expected", [
+    # pay with fail_rate 0 to force success; the booking is persisted
+    pytest.param("AI-201", START_AI201_TWO_JSON, PASSENGER_HAPPY_JSON, PAY_SUCCEED_JSON, "confirmed",
+                 id="confirmed", marks=pytest.mark.database),
+    # use fail_rate=1.0 to guarantee failure; only the in-memory seats are touched
+    pytest.param("AI-202", START_AI202_ONE_JSON, PASSENGER_FAIL_JSON, PAY_FAIL_JSON, "payment_failed",
+                 id="payment_failed"),
+])
+async def test_booking_flow(client, app_main, flight_id, start, passenger, payment, expected):
     # check initial seats
-    flight = next(f for f in app_main.flights_db if f["flight_id"] == "AI-201")
+    flight = app_main.flights_by_id[flight_id]
     initial_seats = flight["seats_available"]
 
     # start booking (reserve seats)
-    resp = client.post("/booking_flow/start", json={"flight_id": "AI-201", "seats": 2})
+    resp = await _post_json(client, "/booking_flow/start", start)
     assert resp.status_code == 200
     data = resp.json()
     pnr = data["pnr"]
     assert data["status"] == "reserved"
 
     # attach passenger
-    passenger = {
-        "full_name": "Test User",
-        "last_name": "User",
-        "age": 30,
-        "phone": 9000000000,
-        "passport_no": "P1234567"
-    }
-    resp = client.post(f"/booking_flow/{pnr}/passenger", json=passenger)
+    resp = await _post_json(client, f"/booking_flow/{pnr}/passenger", passenger)
     assert resp.status_code == 200
     assert resp.json()["status"] == "pending_payment"
 
-    # pay with fail_rate 0 to force success
-    resp = client.post(f"/booking_flow/{pnr}/pay", json={"payment_method": "card", "fail_rate": 0.0})
+    resp = await _post_json(client, f"/booking_flow/{pnr}/pay", payment)
     assert resp.status_code == 200
     pay = resp.json()
-    assert pay["status"] == "confirmed"
-    booking_id = pay["booking_id"]
-
-    # booking persisted in DB
-    resp = client.get(f"/bookings/{booking_id}")
-    assert resp.status_code == 200
-    persisted = resp.json()
-    assert persisted["booking_id"] == booking_id
-    assert persisted["status"] == "confirmed"
-
-    # cancel booking
-    resp = client.delete(f"/bookings/{booking_id}")
-    assert resp.status_code == 200
-    cancelled = resp.json()
-    assert cancelled["status"] == "cancelled"
-
-    # seats should have been released
-    flight_after = next(f for f in app_main.flights_db if f["flight_id"] == "AI-201")
+    assert pay["status"] == expected
+
+    if expected == "confirmed":
+        booking_id = pay["booking_id"]
+
+        # booking persisted in DB
+        resp = await client.get(f"/bookings/{booking_id}")
+        assert resp.status_code == 200
+        persisted = resp.json()
+        assert persisted["booking_id"] == booking_id
+        assert persisted["status"] == "confirmed"
+
+        # cancel booking
+        resp = await client.delete(f"/bookings/{booking_id}")
+        assert resp.status_code == 200
+        cancelled = resp.json()
+        assert cancelled["status"] == "cancelled"
+
+    # seats should have been released (by the cancellation or the failed payment)
+    flight_after = app_main.flights_by_id[flight_id]
     assert flight_after["seats_available"] == initial_seats
 
 
-def test_payment_failure_releases_seats(tmp_path):
-    setup_test_db(tmp_path)
-    import main as app_main
-    client = TestClient(app_main.app)
+async def test_insufficient_seats(client, app_main):
+    # attempt to reserve more seats than available
+    flight = app_main.flights_by_id["AI-201"]
+    resp = await client.post("/booking_flow/start", json={"flight_id": "AI-201", "seats": flight["seats_available"] + 10})
+    assert resp.status_code == 400
 
-    flight = next(f for f in app_main.flights_db if f["flight_id"] == "AI-202")
-    initial = flight["seats_available"]
 
-    resp = client.post("/booking_flow/start", json={"flight_id": "AI-202", "seats": 1})
+@pytest.mark.database
+async def test_cancel_bulk(client, app_main, flights_table):
+    import database
+    flight = app_main.flights_by_id["AI-201"]
+    initial_seats = flight["seats_available"]
+    first = _confirm_booking(app_main, "AI-201", PASSENGER_PNR)["booking_id"]
+    second = _confirm_booking(app_main, "AI-201", PASSENGER_SEARCH)["booking_id"]
+    # cancel one booking up front so the batch finds it already cancelled
+    resp = await client.delete(f"/bookings/{second}")
     assert resp.status_code == 200
-    pnr = resp.json()["pnr"]
 
-    resp = client.post(f"/booking_flow/{pnr}/passenger", json={
-        "full_name": "Fail User",
-        "last_name": "User",
-        "age": 28,
-        "phone": 9111111111,
-        "passport_no": "P7654321"
-    })
+    # repeated ids are cancelled (and release their seat) and reported only once
+    resp = await client.post("/bookings/cancel_bulk", json={"booking_ids": [first, first, second, 999999, 999999]})
     assert resp.status_code == 200
+    result = resp.json()
+    assert [c["booking_id"] for c in result["cancelled"]] == [first]
+    assert result["cancelled"][0]["seats_released"] == 1
+    assert result["already_cancelled"] == [second]
+    assert result["not_found"] == [999999]
 
-    # use fail_rate=1.0 to guarantee failure
-    resp = client.post(f"/booking_flow/{pnr}/pay", json={"payment_method": "card", "fail_rate": 1.0})
-    assert resp.status_code == 200
-    assert resp.json()["status"] == "payment_failed"
+    resp = await client.get(f"/bookings/{first}")
+    assert resp.json()["status"] == "cancelled"
+    # seats are back in both the DB and the in-memory flight
+    assert database.get_flight("AI-201").seats_available == initial_seats
+    assert flight["seats_available"] == initial_seats
 
-    # seats returned
-    flight_after = next(f for f in app_main.flights_db if f["flight_id"] == "AI-202")
-    assert flight_after["seats_available"] == initial
 
+@pytest.mark.database
+async def test_payment_failure_releases_db_and_memory_seats(client, app_main, flights_table):
+    import database
+    flight = app_main.flights_by_id["AI-202"]
+    initial_seats = flight["seats_available"]
+    resp = await _post_json(client, "/booking_flow/start", START_AI202_ONE_JSON)
+    pnr = resp.json()["pnr"]
+    assert database.get_flight("AI-202").seats_available == initial_seats - 1
+    await _post_json(client, f"/booking_flow/{pnr}/passenger", PASSENGER_FAIL_JSON)
+    resp = await _post_json(client, f"/booking_flow/{pnr}/pay", PAY_FAIL_JSON)
+    assert resp.json()["status"] == "payment_failed"
+    assert database.get_flight("AI-202").seats_available == initial_seats
+    assert flight["seats_available"] == initial_seats
 
-def test_insufficient_seats(tmp_path):
-    setup_test_db(tmp_path)
-    import main as app_main
-    client = TestClient(app_main.app)
+    # the failed booking can't be paid again, whether the retry would fail or succeed
+    for payment in (PAY_FAIL_JSON, PAY_SUCCEED_JSON):
+        resp = await _post_json(client, f"/booking_flow/{pnr}/pay", payment)
+        assert resp.status_code == 400
+    assert database.get_flight("AI-202").seats_available == initial_seats
+    assert flight["seats_available"] == initial_seats
+    resp = await client.get("/bookings")
+    assert resp.json() == []
 
-    # attempt to reserve more seats than available
-    flight = next(f for f in app_main.flights_db if f["flight_id"] == "AI-201")
-    resp = client.post("/booking_flow/start", json={"flight_id": "AI-201", "seats": flight["seats_available"] + 10})
-    assert resp.status_code == 400
+    # cancelling the failed booking doesn't give its seats back a second time
+    resp = await client.delete(f"/bookings/{pnr}")
+    assert resp.status_code == 200
+    assert flight["seats_available"] == initial_seats
 
 
-def test_get_booking_by_pnr_and_temporary(tmp_path):
-    # prepare db and app
-    setup_test_db(tmp_path)
-    import main as app_main
-    client = TestClient(app_main.app)
+@pytest.mark.database
+async def test_cancel_booking_by_digit_heavy_pnr(client, app_main, monkeypatch):
+    # the highest draw used to spell "999999", which DELETE /bookings/{booking_id:int} claims
+    monkeypatch.setattr(app_main.secrets, "randbelow", lambda n: n - 1)
+    pay = _confirm_booking(app_main, "AI-201", PASSENGER_PNR)
+    pnr = pay["pnr"]
+    assert not pnr.isdigit()
 
-    # create a persisted booking through flow
-    resp = client.post("/booking_flow/start", json={"flight_id": "AI-201", "seats": 1})
+    resp = await client.delete(f"/bookings/{pnr}")
     assert resp.status_code == 200
-    pnr_tmp = resp.json()["pnr"]
+    assert resp.json()["cancelled_booking"]["pnr"] == pnr
+    assert pnr not in app_main.bookings_db
 
-    # attach passenger
-    passenger = {
-        "full_name": "PNR Test",
-        "last_name": "User",
-        "age": 31,
-        "phone": 9001001001,
-        "passport_no": "PX11111"
-    }
-    resp = client.post(f"/booking_flow/{pnr_tmp}/passenger", json=passenger)
-    assert resp.status_code == 200
 
-    # confirm payment
-    resp = client.post(f"/booking_flow/{pnr_tmp}/pay", json={"payment_method": "card", "fail_rate": 0.0})
-    assert resp.status_code == 200
-    pay = resp.json()
+@pytest.mark.database
+async def test_get_booking_by_pnr_and_temporary(client, app_main):
+    # create a persisted booking through flow
+    pay = _confirm_booking(app_main, "AI-201", PASSENGER_PNR)
     assert pay["status"] == "confirmed"
     final_pnr = pay["pnr"]
 
     # GET persisted booking by PNR
-    resp = client.get(f"/bookings/pnr/{final_pnr}")
+    resp = await client.get(f"/bookings/pnr/{final_pnr}")
     assert resp.status_code == 200
     data = resp.json()
     assert data["pnr"] == final_pnr
     assert data["status"] == "confirmed"
 
     # create a temporary booking (no payment)
-    resp = client.post("/booking_flow/start", json={"flight_id": "AI-202", "seats": 1})
+    resp = await _post_json(client, "/booking_flow/start", START_AI202_ONE_JSON)
     assert resp.status_code == 200
     temp_pnr = resp.json()["pnr"]
 
     # GET temporary booking via /bookings/pnr should fall back to temp bookings
-    resp = client.get(f"/bookings/pnr/{temp_pnr}")
+    resp = await client.get(f"/bookings/pnr/{temp_pnr}")
     assert resp.status_code == 200
     tb = resp.json()
     assert tb["pnr"] == temp_pnr
 
 
-def test_search_endpoint(tmp_path):
-    setup_test_db(tmp_path)
-    import main as app_main
-    client = TestClient(app_main.app)
-
+@pytest.mark.database
+async def test_search_endpoint(client, app_main):
     # create a persisted booking with known passenger name
-    resp = client.post("/booking_flow/start", json={"flight_id": "AI-201", "seats": 1})
-    pnr = resp.json()["pnr"]
-    passenger = {
-        "full_name": "Search User",
-        "last_name": "Finder",
-        "age": 29,
-        "phone": 9002002002,
-        "passport_no": "S11111"
-    }
-    client.post(f"/booking_flow/{pnr}/passenger", json=passenger)
-    client.post(f"/booking_flow/{pnr}/pay", json={"payment_method": "card", "fail_rate": 0.0})
+    _confirm_booking(app_main, "AI-201", PASSENGER_SEARCH)
 
     # search by name (persisted)
-    resp = client.get("/bookings/search", params={"name": "Search"})
-    # debug output when something goes wrong
-    if resp.status_code != 200:
-        print('SEARCH RESPONSE (DEBUG):', resp.status_code, resp.text)
-    assert resp.status_code == 200
+    resp = await client.get("/bookings/search", params={"name": "Search"})
+    assert resp.status_code == 200, resp.text
     results = resp.json()
     assert any("Search User" in (b.get("passenger_name") or "") for b in results)
 
     # create a temporary booking and attach passenger
-    resp = client.post("/booking_flow/start", json={"flight_id": "AI-202", "seats": 1})
+    resp = await _post_json(client, "/booking_flow/start", START_AI202_ONE_JSON)
     tmp_pnr = resp.json()["pnr"]
-    tmp_passenger = {
-        "full_name": "Temp Search",
-        "last_name": "Tester",
-        "age": 26,
-        "phone": 9003003003,
-        "passport_no": "TMP12345"
-    }
-    client.post(f"/booking_flow/{tmp_pnr}/passenger", json=tmp_passenger)
+    await _post_json(client, f"/booking_flow/{tmp_pnr}/passenger", PASSENGER_TEMP_SEARCH_JSON)
 
     # search temp bookings by name
-    resp = client.get("/bookings/search", params={"name": "Temp"})
+    resp = await client.get("/bookings/search", params={"name": "Temp"})
     assert resp.status_code == 200
     results = resp.json()
     assert any("Temp Search" in (b.get("passenger_name") or "") for b in results)